@@ -0,0 +1,64 @@
+"""Async wrappers that keep blocking filesystem calls off the event loop
+
+Blocking calls (os.listdir, os.stat, zipfile reads) run in worker threads
+behind a capacity limiter, so a slow disk delays only the requests that
+touch it and cannot exhaust the shared threadpool. Fan-out over the whole
+store (listings) runs behind its own, smaller limiter so one large listing
+cannot take every slot other requests need.
+
+Environment variables:
+  REPROPACK_IO_CONCURRENCY          Maximum concurrent blocking filesystem calls per worker (default: 16).
+  REPROPACK_LISTING_IO_CONCURRENCY  Maximum concurrent per-archive reads for listings per worker (default: 4).
+"""
+
+import asyncio
+import functools
+import os
+import weakref
+from typing import Any, Callable, Iterable, List, TypeVar
+
+import anyio
+import anyio.to_thread
+
+
+T = TypeVar("T")
+
+IO_CONCURRENCY = int(os.getenv("REPROPACK_IO_CONCURRENCY", "16"))
+LISTING_IO_CONCURRENCY = int(os.getenv("REPROPACK_LISTING_IO_CONCURRENCY", "4"))
+
+# One limiter per event loop and pool; limiters cannot be shared across loops
+_limiters: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_POOL_SIZES = {"io": IO_CONCURRENCY, "listing": LISTING_IO_CONCURRENCY}
+
+
+def _limiter(pool: str = "io") -> anyio.CapacityLimiter:
+    loop = asyncio.get_running_loop()
+    limiters = _limiters.setdefault(loop, {})
+    limiter = limiters.get(pool)
+    if limiter is None:
+        limiter = limiters[pool] = anyio.CapacityLimiter(_POOL_SIZES[pool])
+    return limiter
+
+
+async def run_io(func: Callable[..., T], *args: Any, pool: str = "io") -> T:
+    """Run a blocking filesystem call in a worker thread"""
+    return await anyio.to_thread.run_sync(functools.partial(func, *args), limiter=_limiter(pool))
+
+
+async def map_io(func: Callable[[Any], T], items: Iterable[Any], pool: str = "listing") -> List[T]:
+    """Apply a blocking call to every item concurrently, bounded by the listing limiter"""
+    items = list(items)
+    results: List[Any] = [None] * len(items)
+    pending = iter(enumerate(items))
+
+    async def worker() -> None:
+        # A fixed set of workers pulls from the shared iterator, so a large
+        # store does not create one task per item
+        for position, item in pending:
+            results[position] = await run_io(func, item, pool=pool)
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(min(_POOL_SIZES[pool], len(items))):
+            tg.start_soon(worker)
+    return results
+
@@ -50,7 +50,7 @@ def demo_package_creation():
     packages_dir = "packages"
     
     try:
-        package_path, file_size = create_package_archive(sample_request, package_id, packages_dir)
+        package_path, file_size, _ = create_package_archive(sample_request, package_id, packages_dir)
         
         print(f"✅ Package created successfully!")
         print(f"📋 Package ID: {package_id}")
@@ -0,0 +1,169 @@
+"""Background-maintained in-memory views over the package store
+
+On first load, archives with an up-to-date record in the ``.index.jsonl``
+file written by ``reindex.py`` are indexed from that record instead of
+being opened.
+
+Environment variables:
+  REPROPACK_INDEX_REFRESH_SECONDS  How stale an index may get before a query schedules a
+                                   background rescan of the packages directory, which picks up
+                                   packages created or removed by other workers (default: 5).
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from utils import load_package_metadata
+
+
+logger = logging.getLogger("repropack.indexing")
+
+INDEX_FILENAME = ".index.jsonl"
+
+
+def load_index_records(index_path: str) -> Dict[str, Dict[str, Any]]:
+    """Read an index file into {archive name: latest successful record}"""
+    records: Dict[str, Dict[str, Any]] = {}
+    try:
+        with open(index_path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn last line from an interrupted run
+                    continue
+                if "error" in record:
+                    records.pop(record["file_name"], None)
+                else:
+                    records[record["file_name"]] = record
+    except FileNotFoundError:
+        pass
+    return records
+
+class BackgroundIndex:
+    """Base class for indexes updated off the request path
+
+    Writes are queued and applied by one background thread per index, so
+    package creation never waits on indexing. Subclasses implement ``add`` and
+    ``remove`` and record every indexed archive in ``self._files``.
+    """
+
+    thread_name = "repropack-index"
+
+    def __init__(self, refresh_seconds: Optional[float] = None):
+        if refresh_seconds is None:
+            refresh_seconds = float(os.getenv("REPROPACK_INDEX_REFRESH_SECONDS", "5"))
+        self.refresh_seconds = refresh_seconds
+
+        self._lock = threading.RLock()
+        self._files: Dict[str, Any] = {}
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._last_sync = 0.0
+        # Archives that failed to index, keyed by name -> (mtime_ns, size), so an
+        # unchanged bad archive is not retried (and logged) on every rescan
+        self._rejected: Dict[str, Any] = {}
+
+    def add(self, filename: str, metadata: Dict[str, Any], file_size: int) -> None:
+        raise NotImplementedError
+
+    def remove(self, filename: str) -> None:
+        raise NotImplementedError
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            action, args = self._queue.get()
+            try:
+                if action == "add":
+                    self.add(*args)
+                elif action == "sync":
+                    self.sync(*args)
+            except Exception:
+                # A bad archive must not kill the indexer
+                logger.exception("%s failed to apply %s", self.thread_name, action)
+            finally:
+                self._queue.task_done()
+
+    def submit(self, filename: str, metadata: Dict[str, Any], file_size: int) -> None:
+        """Queue a freshly created package for indexing"""
+        self._ensure_worker()
+        self._queue.put(("add", (filename, metadata, file_size)))
+
+    def schedule_sync(self, packages_dir: str) -> None:
+        """Queue a rescan of the packages directory"""
+        self._ensure_worker()
+        self._last_sync = time.monotonic()
+        self._queue.put(("sync", (packages_dir,)))
+
+    def flush(self) -> None:
+        """Block until all queued index updates have been applied"""
+        self._queue.join()
+
+    def warm(self, packages_dir: str) -> None:
+        """Make sure the index is loaded, and schedule a refresh if it is stale"""
+        if not self._ready.is_set():
+            with self._lock:
+                if self._last_sync == 0.0:
+                    self.schedule_sync(packages_dir)
+            self._ready.wait()
+        elif time.monotonic() - self._last_sync > self.refresh_seconds:
+            self.schedule_sync(packages_dir)
+
+    def sync(self, packages_dir: str) -> None:
+        """Index archives that appeared on disk and drop ones that disappeared"""
+        try:
+            on_disk = {
+                entry.name: entry for entry in os.scandir(packages_dir)
+                if entry.name.endswith('.zip')
+            }
+            with self._lock:
+                known = set(self._files)
+            # Cold start: every archive is new, so use the reindex records if present
+            seed = load_index_records(os.path.join(packages_dir, INDEX_FILENAME)) if not known else {}
+            for filename in on_disk.keys() - known:
+                self._index_file(on_disk[filename], seed.get(filename))
+            for filename in known - on_disk.keys():
+                self.remove(filename)
+            for filename in self._rejected.keys() - on_disk.keys():
+                del self._rejected[filename]
+        finally:
+            # Queries waiting on the first load must not hang if it fails
+            self._ready.set()
+
+    def _index_file(self, entry: "os.DirEntry", record: Optional[Dict[str, Any]] = None) -> None:
+        """Index one archive; a malformed or foreign archive is logged and skipped"""
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            # Removed between scandir and stat
+            return
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if self._rejected.get(entry.name) == signature:
+            return
+        try:
+            # Archives are immutable once published, so a record of the same size is current
+            if record and record.get("metadata") and record.get("file_size") == stat.st_size:
+                metadata = record["metadata"]
+            else:
+                metadata = load_package_metadata(entry.path)
+            if not metadata:
+                raise ValueError("no readable metadata.json")
+            self.add(entry.name, metadata, stat.st_size)
+        except Exception:
+            self._rejected[entry.name] = signature
+            logger.exception("%s skipped unindexable archive %s", self.thread_name, entry.name)
+        else:
+            self._rejected.pop(entry.name, None)
@@ -0,0 +1,272 @@
+"""Archive checksums, verification and background scrubbing
+
+Each package carries a manifest.json with the SHA-256 of every other member,
+and the digest of the whole archive is written next to it as
+``<archive>.sha256`` (sha256sum format).
+
+Environment variables:
+  REPROPACK_SCRUB_INTERVAL_SECONDS   Pause between background scrub passes over the store
+                                     (0 disables the scrubber, default).
+  REPROPACK_SCRUB_BYTES_PER_SECOND   Read budget for the scrubber (default: 8388608).
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+import zipfile
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+
+MANIFEST_NAME = "manifest.json"
+DIGEST_SUFFIX = ".sha256"
+HASH_CHUNK_SIZE = 1024 * 1024
+SCRUB_LOCK_NAME = ".scrub.lock"
+SCRUB_FAILURES_NAME = ".scrub-failures.json"
+
+logger = logging.getLogger("repropack.integrity")
+
+
+class _Throttle:
+    """Sleep as needed to keep reads under a bytes-per-second budget"""
+
+    def __init__(self, bytes_per_second: Optional[int]):
+        self.bytes_per_second = bytes_per_second
+        self._started = time.monotonic()
+        self._consumed = 0
+
+    def consume(self, size: int) -> None:
+        if not self.bytes_per_second:
+            return
+        self._consumed += size
+        ahead = self._consumed / self.bytes_per_second - (time.monotonic() - self._started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(path: str, throttle: Optional[_Throttle] = None) -> str:
+    """Hash a file through a memory map, chunk by chunk"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                for offset in range(0, len(mapped), HASH_CHUNK_SIZE):
+                    with view[offset:offset + HASH_CHUNK_SIZE] as chunk:
+                        digest.update(chunk)
+                        if throttle is not None:
+                            throttle.consume(len(chunk))
+    return digest.hexdigest()
+
+
+def build_manifest(members: Dict[str, bytes]) -> str:
+    """Create manifest.json content for the given member contents"""
+    return json.dumps({
+        "algorithm": "sha256",
+        "files": {name: sha256_bytes(content) for name, content in members.items()}
+    }, indent=2)
+
+
+def write_digest_file(package_path: str, digest: str, archive_name: Optional[str] = None) -> str:
+    """Atomically write the ``<archive>.sha256`` sidecar"""
+    digest_path = package_path + DIGEST_SUFFIX
+    temp_path = f"{digest_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as fh:
+        fh.write(f"{digest}  {archive_name or os.path.basename(package_path)}\n")
+    os.replace(temp_path, digest_path)
+    return digest_path
+
+
+def read_digest_file(package_path: str) -> Optional[str]:
+    """Return the recorded archive digest, or None for archives without one"""
+    try:
+        with open(package_path + DIGEST_SUFFIX, "r", encoding="utf-8") as fh:
+            return fh.read().split()[0]
+    except (FileNotFoundError, IndexError):
+        return None
+
+
+def verify_package_archive(package_path: str, bytes_per_second: Optional[int] = None) -> Dict[str, Any]:
+    """Check an archive against its recorded digest and its member manifest"""
+    throttle = _Throttle(bytes_per_second)
+    errors = []
+
+    expected_digest = read_digest_file(package_path)
+    actual_digest = sha256_file(package_path, throttle)
+    if expected_digest is not None and expected_digest != actual_digest:
+        errors.append("Archive digest mismatch")
+
+    members = []
+    has_manifest = False
+    try:
+        with zipfile.ZipFile(package_path, "r") as zipf:
+            if MANIFEST_NAME in zipf.namelist():
+                has_manifest = True
+                manifest = json.loads(zipf.read(MANIFEST_NAME).decode("utf-8"))
+                for name, expected in manifest.get("files", {}).items():
+                    digest = hashlib.sha256()
+                    try:
+                        with zipf.open(name) as member:
+                            for chunk in iter(lambda: member.read(HASH_CHUNK_SIZE), b""):
+                                digest.update(chunk)
+                                throttle.consume(len(chunk))
+                    except KeyError:
+                        errors.append(f"Missing member: {name}")
+                        members.append({"name": name, "ok": False})
+                        continue
+                    ok = digest.hexdigest() == expected
+                    if not ok:
+                        errors.append(f"Checksum mismatch: {name}")
+                    members.append({"name": name, "ok": ok})
+            else:
+                # Legacy archive: fall back to the ZIP CRCs
+                bad_member = zipf.testzip()
+                if bad_member is not None:
+                    errors.append(f"CRC mismatch: {bad_member}")
+    except (zipfile.BadZipFile, json.JSONDecodeError, OSError) as e:
+        errors.append(f"Unreadable archive: {e}")
+
+    return {
+        "ok": not errors,
+        "archive_sha256": actual_digest,
+        "recorded_sha256": expected_digest,
+        "has_manifest": has_manifest,
+        "members": members,
+        "errors": errors,
+        "checked_at": datetime.now().isoformat()
+    }
+
+
+def read_scrub_failures(packages_dir: str) -> Dict[str, Dict[str, Any]]:
+    """Return the scrubber's recorded failures for archives that still exist"""
+    try:
+        with open(os.path.join(packages_dir, SCRUB_FAILURES_NAME), "r", encoding="utf-8") as fh:
+            failures = json.load(fh)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return {
+        filename: result for filename, result in failures.items()
+        if os.path.exists(os.path.join(packages_dir, filename))
+    }
+
+
+def _write_scrub_failures(packages_dir: str, failures: Dict[str, Dict[str, Any]]) -> None:
+    """Atomically replace the shared failures file"""
+    path = os.path.join(packages_dir, SCRUB_FAILURES_NAME)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as fh:
+        json.dump(failures, fh, indent=2)
+    os.replace(temp_path, path)
+
+
+def _try_lock(path: str):
+    """Take a non-blocking exclusive lock; returns the open file or None if held elsewhere"""
+    try:
+        import fcntl
+    except ImportError:
+        # No flock (Windows): every process scrubs
+        return open(path, "a")
+    fh = open(path, "a")
+    try:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        fh.close()
+        return None
+    return fh
+
+
+class ArchiveScrubber:
+    """Background thread that re-verifies every archive at a bounded read rate
+
+    When several workers share the store only the one holding the scrub lock
+    does the work. Results go to a shared file in the store so every worker
+    reports the same failures.
+    """
+
+    def __init__(self, packages_dir: str, interval_seconds: Optional[float] = None,
+                 bytes_per_second: Optional[int] = None):
+        if interval_seconds is None:
+            interval_seconds = float(os.getenv("REPROPACK_SCRUB_INTERVAL_SECONDS", "0"))
+        if bytes_per_second is None:
+            bytes_per_second = int(os.getenv("REPROPACK_SCRUB_BYTES_PER_SECOND", str(8 * 1024 * 1024)))
+        self.packages_dir = packages_dir
+        self.interval_seconds = interval_seconds
+        self.bytes_per_second = bytes_per_second
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval_seconds > 0
+
+    def start(self) -> None:
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="repropack-scrubber", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    @property
+    def failures(self) -> Dict[str, Dict[str, Any]]:
+        """Failures recorded by whichever worker scrubs the store"""
+        return read_scrub_failures(self.packages_dir)
+
+    def scrub_once(self) -> int:
+        """Verify each archive in the store once; returns how many were checked"""
+        checked = 0
+        failures = read_scrub_failures(self.packages_dir)
+        for filename in sorted(os.listdir(self.packages_dir)):
+            if self._stop.is_set():
+                break
+            if not filename.endswith(".zip"):
+                continue
+            package_path = os.path.join(self.packages_dir, filename)
+            try:
+                result = verify_package_archive(package_path, self.bytes_per_second)
+            except FileNotFoundError:
+                # Removed while we were scrubbing
+                result = None
+            else:
+                checked += 1
+            if result is None or result["ok"]:
+                if failures.pop(filename, None) is not None:
+                    _write_scrub_failures(self.packages_dir, failures)
+            else:
+                failures[filename] = result
+                # Publish as soon as found rather than at the end of a long pass
+                _write_scrub_failures(self.packages_dir, failures)
+                logger.warning("Integrity check failed for %s: %s", filename, "; ".join(result["errors"]))
+        # Also drops archives deleted since they failed
+        _write_scrub_failures(self.packages_dir, {
+            filename: result for filename, result in failures.items()
+            if os.path.exists(os.path.join(self.packages_dir, filename))
+        })
+        return checked
+
+    def _run(self) -> None:
+        lock_path = os.path.join(self.packages_dir, SCRUB_LOCK_NAME)
+        lock = None
+        try:
+            while not self._stop.is_set():
+                # Keep the lock once held so one worker owns scrubbing
+                if lock is None:
+                    lock = _try_lock(lock_path)
+                if lock is not None:
+                    try:
+                        self.scrub_once()
+                    except Exception:
+                        logger.exception("Archive scrub pass failed")
+                self._stop.wait(self.interval_seconds)
+        finally:
+            if lock is not None:
+                lock.close()
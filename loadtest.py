@@ -0,0 +1,446 @@
+"""
+Load and soak test harness for ReproPack
+
+Three subcommands:
+
+  generate  Fill a package store with N synthetic packages through
+            create_package_archive, with realistic spreads of dependency
+            counts, environment variables, scripts and description sizes.
+
+  run       Drive a running server at a target request rate with a mix of
+            create/list/download traffic, reporting throughput, error rate,
+            latency percentiles and (given --server-pid) server memory growth.
+
+  scale     Start the server once per worker count against the same store,
+            load each with identical traffic and report throughput scaling.
+
+Usage:
+  python loadtest.py generate --count 10000 --packages-dir /tmp/store
+  python loadtest.py run --base-url http://localhost:8000 --rps 50 --duration 600 \\
+      --mix create=1,list=1,download=8 --server-pid 12345
+  python loadtest.py scale --packages-dir /tmp/store --workers 1,2,4 --rps 500 --duration 30 \\
+      --mix list=1,download=8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from multiprocessing import Pool
+from typing import Any, Dict, List, Optional
+
+from models import CreatePackageRequest, DependencyModel, MAX_DEPENDENCIES
+from utils import create_package_archive, generate_package_id
+
+
+POPULAR_PACKAGES = [
+    "numpy", "pandas", "requests", "scipy", "matplotlib", "scikit-learn", "torch",
+    "tensorflow", "flask", "django", "fastapi", "uvicorn", "pydantic", "sqlalchemy",
+    "pytest", "black", "jupyter", "seaborn", "boto3", "redis", "celery", "httpx",
+    "pillow", "opencv-python", "transformers", "xgboost", "lightgbm", "polars",
+    "pyarrow", "click", "rich", "typer", "aiohttp", "psycopg2-binary", "alembic",
+]
+VERSION_OPERATORS = ["", "", "", "==", ">=", "~=", "<"]
+WORDS = (
+    "reproducible environment data pipeline model training service api notebook "
+    "analysis experiment benchmark dataset feature inference batch stream cache"
+).split()
+
+
+# -- synthetic store ---------------------------------------------------------
+
+def synthetic_request(rng: random.Random) -> CreatePackageRequest:
+    """Build one request with realistic (long-tailed) sizes"""
+    # Most projects pin a handful of packages; a few pin hundreds
+    dependency_count = min(MAX_DEPENDENCIES, int(rng.lognormvariate(2.0, 0.9)))
+    names = rng.sample(POPULAR_PACKAGES, min(dependency_count, len(POPULAR_PACKAGES)))
+    names += [f"internal-lib-{rng.randrange(10000)}" for _ in range(dependency_count - len(names))]
+    dependencies = [
+        DependencyModel(
+            name=name,
+            version=f"{rng.choice(VERSION_OPERATORS)}{rng.randint(0, 5)}.{rng.randint(0, 30)}.{rng.randint(0, 9)}"
+        )
+        for name in names
+    ]
+    return CreatePackageRequest(
+        project_name=f"{rng.choice(WORDS)}-{rng.choice(WORDS)}-{rng.randrange(1000)}",
+        author=f"author{int(rng.paretovariate(1.2)) % 500}",
+        description=" ".join(rng.choices(WORDS, k=min(1000, int(rng.expovariate(1 / 40))))) or None,
+        dependencies=dependencies,
+        environment_variables={
+            f"VAR_{i}_{rng.choice(WORDS).upper()}": rng.choice(WORDS)
+            for i in range(min(50, int(rng.expovariate(1 / 4))))
+        },
+        setup_scripts=[f"echo step {i}" for i in range(min(20, int(rng.expovariate(1 / 2))))],
+        dataset_links=[
+            f"https://data.example.org/{rng.choice(WORDS)}/{rng.randrange(10**6)}.csv"
+            for _ in range(min(10, int(rng.expovariate(1))))
+        ],
+    )
+
+
+def _generate_one(args) -> int:
+    packages_dir, seed = args
+    rng = random.Random(seed)
+    request = synthetic_request(rng)
+    _, file_size, _ = create_package_archive(request, generate_package_id(), packages_dir)
+    return file_size
+
+
+def generate_store(packages_dir: str, count: int, workers: Optional[int] = None, seed: int = 0) -> Dict[str, Any]:
+    """Create ``count`` synthetic packages in ``packages_dir``"""
+    os.makedirs(packages_dir, exist_ok=True)
+    started = time.monotonic()
+    tasks = [(packages_dir, seed * 1_000_003 + i) for i in range(count)]
+    if workers == 1:
+        sizes = [_generate_one(task) for task in tasks]
+    else:
+        with Pool(workers) as pool:
+            sizes = pool.map(_generate_one, tasks, chunksize=32)
+    elapsed = max(time.monotonic() - started, 1e-9)
+    return {
+        "packages": count,
+        "bytes": sum(sizes),
+        "seconds": round(elapsed, 3),
+        "packages_per_second": round(count / elapsed, 1),
+    }
+
+
+# -- load driver ---------------------------------------------------------------
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def _process_rss_bytes(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _descendant_pids(pid: int) -> List[int]:
+    """All processes below ``pid``, e.g. the workers of a uvicorn supervisor"""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r", encoding="ascii", errors="replace") as fh:
+                # The command name may contain spaces; fields resume after its ')'
+                ppid = int(fh.read().rpartition(")")[2].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    found, pending = [], [pid]
+    while pending:
+        for child in children.get(pending.pop(), []):
+            found.append(child)
+            pending.append(child)
+    return found
+
+
+def read_rss_bytes(pid: int) -> Optional[int]:
+    """Resident set size of a process and all its descendants (Linux /proc only)
+
+    With ``--workers N`` uvicorn serves from child processes, so the
+    supervisor's own RSS alone would miss nearly all server memory.
+    """
+    total = _process_rss_bytes(pid)
+    if total is None:
+        return None
+    try:
+        descendants = _descendant_pids(pid)
+    except OSError:
+        return total
+    return total + sum(_process_rss_bytes(child) or 0 for child in descendants)
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("create", "list", "download"):
+            raise ValueError(f"Unknown operation in mix: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class LoadStats:
+    """Latency and error bookkeeping for one run"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, op: str, seconds: float, ok: bool) -> None:
+        self.latencies.setdefault(op, []).append(seconds)
+        if not ok:
+            self.errors[op] = self.errors.get(op, 0) + 1
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        ops = {}
+        for op, values in self.latencies.items():
+            values = sorted(values)
+            ops[op] = {
+                "requests": len(values),
+                "errors": self.errors.get(op, 0),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2),
+            }
+        total = sum(len(v) for v in self.latencies.values())
+        errors = sum(self.errors.values())
+        return {
+            "requests": total,
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+            "operations": ops,
+        }
+
+
+async def run_load(
+    base_url: str,
+    rps: float,
+    duration: float,
+    mix: Dict[str, float],
+    max_in_flight: int = 256,
+    server_pid: Optional[int] = None,
+    report_interval: float = 10.0,
+    seed: int = 0,
+    transport=None,
+    out=sys.stderr
+) -> Dict[str, Any]:
+    """Send open-loop (Poisson) traffic at ``rps`` for ``duration`` seconds"""
+    import httpx
+
+    rng = random.Random(seed)
+    ops = list(mix)
+    weights = [mix[op] for op in ops]
+    stats = LoadStats()
+    package_ids: List[str] = []
+    in_flight = asyncio.Semaphore(max_in_flight)
+    tasks = set()
+
+    rss_start = read_rss_bytes(server_pid) if server_pid else None
+    rss_max = rss_start
+
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, timeout=60) as client:
+        listing = await client.get("/list-packages")
+        if listing.status_code == 200:
+            package_ids.extend(p["package_id"] for p in listing.json()["packages"])
+
+        async def one_request(op: str) -> None:
+            started = time.perf_counter()
+            ok = False
+            try:
+                if op == "create":
+                    payload = json.loads(synthetic_request(rng).model_dump_json())
+                    response = await client.post("/create-package", json=payload)
+                    if response.status_code == 200:
+                        package_ids.append(response.json()["package_id"])
+                elif op == "list":
+                    response = await client.get("/list-packages")
+                else:
+                    response = await client.get(f"/download-package/{rng.choice(package_ids)}")
+                    await response.aread()
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            finally:
+                stats.record(op, time.perf_counter() - started, ok)
+                in_flight.release()
+
+        started = time.monotonic()
+        next_send = started
+        next_report = started + report_interval
+        while True:
+            now = time.monotonic()
+            if now - started >= duration:
+                break
+            if now < next_send:
+                await asyncio.sleep(next_send - now)
+            next_send += rng.expovariate(rps)
+
+            op = rng.choices(ops, weights)[0]
+            if op == "download" and not package_ids:
+                op = "list"
+            await in_flight.acquire()
+            task = asyncio.create_task(one_request(op))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+            if server_pid:
+                rss = read_rss_bytes(server_pid)
+                if rss is not None:
+                    rss_max = max(rss_max or rss, rss)
+            if out is not None and time.monotonic() >= next_report:
+                progress = stats.summary(time.monotonic() - started)
+                print(json.dumps({k: progress[k] for k in ("requests", "errors", "throughput_rps")}), file=out)
+                next_report += report_interval
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+
+    summary = stats.summary(elapsed)
+    if server_pid:
+        rss_end = read_rss_bytes(server_pid)
+        summary["memory"] = {
+            "rss_start_bytes": rss_start,
+            "rss_end_bytes": rss_end,
+            "rss_max_bytes": rss_max,
+            "rss_growth_bytes": (rss_end - rss_start) if rss_start and rss_end else None,
+        }
+    return summary
+
+
+# -- worker scaling ------------------------------------------------------------
+
+def _wait_for_server(base_url: str, server: subprocess.Popen, timeout: float = 30) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with status {server.returncode}")
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"Server did not become healthy within {timeout}s")
+
+
+def measure_scaling(
+    worker_counts: List[int],
+    packages_dir: str,
+    rps: float,
+    duration: float,
+    mix: Dict[str, float],
+    port: int = 8765,
+    max_in_flight: int = 256,
+    seed: int = 0,
+    out=sys.stderr
+) -> Dict[str, Any]:
+    """Serve ``packages_dir`` with each worker count in turn and load it identically
+
+    ``rps`` should exceed what one worker can serve, so throughput measures
+    capacity rather than the offered rate. A mix with ``create`` grows the
+    store between runs, which slows later listings and understates speedup.
+    """
+    base_url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "REPROPACK_PACKAGES_DIR": os.path.abspath(packages_dir),
+        "REPROPACK_RATE_LIMIT_PER_MINUTE": "0",
+    }
+    results = []
+    for workers in worker_counts:
+        server = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                "--port", str(port), "--workers", str(workers), "--log-level", "warning",
+            ],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env
+        )
+        try:
+            _wait_for_server(base_url, server)
+            summary = asyncio.run(run_load(
+                base_url, rps, duration, mix, max_in_flight=max_in_flight, seed=seed, out=None
+            ))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        result = {"workers": workers, **{k: summary[k] for k in ("requests", "error_rate", "throughput_rps")}}
+        result["p99_ms"] = {op: stats["p99_ms"] for op, stats in summary["operations"].items()}
+        if out is not None:
+            print(json.dumps(result), file=out)
+        results.append(result)
+
+    baseline = results[0]["throughput_rps"] if results else 0
+    for result in results:
+        result["speedup"] = round(result["throughput_rps"] / baseline, 2) if baseline else None
+    return {"packages_dir": packages_dir, "offered_rps": rps, "results": results}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="ReproPack load/soak test harness")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    gen = subparsers.add_parser("generate", help="Create a synthetic package store")
+    gen.add_argument("--count", type=int, required=True, help="Number of packages to create")
+    gen.add_argument(
+        "--packages-dir",
+        default=os.getenv("REPROPACK_PACKAGES_DIR", "packages"),
+        help="Target store (default: $REPROPACK_PACKAGES_DIR or 'packages')"
+    )
+    gen.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    gen.add_argument("--seed", type=int, default=0)
+
+    run = subparsers.add_parser("run", help="Drive a running server")
+    run.add_argument("--base-url", default="http://localhost:8000")
+    run.add_argument("--rps", type=float, default=20, help="Target request rate")
+    run.add_argument("--duration", type=float, default=60, help="Seconds to run")
+    run.add_argument("--mix", default="create=1,list=1,download=8", help="Weighted operation mix")
+    run.add_argument("--max-in-flight", type=int, default=256)
+    run.add_argument("--server-pid", type=int, help="Server process to sample RSS from, workers included (Linux)")
+    run.add_argument("--report-interval", type=float, default=10)
+    run.add_argument("--seed", type=int, default=0)
+
+    scale = subparsers.add_parser("scale", help="Measure throughput across server worker counts")
+    scale.add_argument(
+        "--packages-dir",
+        default=os.getenv("REPROPACK_PACKAGES_DIR", "packages"),
+        help="Store to serve (default: $REPROPACK_PACKAGES_DIR or 'packages')"
+    )
+    scale.add_argument("--workers", default="1,2,4", help="Comma list of worker counts to compare")
+    scale.add_argument("--rps", type=float, default=500, help="Offered request rate; set above single-worker capacity")
+    scale.add_argument("--duration", type=float, default=30, help="Seconds per worker count")
+    scale.add_argument(
+        "--mix",
+        default="list=1,download=8",
+        help="Weighted operation mix; read-only by default so every worker count sees the same store"
+    )
+    scale.add_argument("--port", type=int, default=8765)
+    scale.add_argument("--max-in-flight", type=int, default=256)
+    scale.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        result = generate_store(args.packages_dir, args.count, args.workers, args.seed)
+    elif args.command == "scale":
+        result = measure_scaling(
+            [int(n) for n in args.workers.split(",")], args.packages_dir, args.rps, args.duration,
+            parse_mix(args.mix), port=args.port, max_in_flight=args.max_in_flight, seed=args.seed
+        )
+    else:
+        result = asyncio.run(run_load(
+            args.base_url, args.rps, args.duration, parse_mix(args.mix),
+            max_in_flight=args.max_in_flight,
+            server_pid=args.server_pid,
+            report_interval=args.report_interval,
+            seed=args.seed
+        ))
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
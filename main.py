@@ -1,29 +1,59 @@
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Request, Query
+from fastapi.responses import FileResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 import os
-from pathlib import Path
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from urllib.parse import quote
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 from models import (
     CreatePackageRequest, 
     PackageResponse, 
     PackageListResponse, 
-    PackageMetadata
+    PackageMetadata,
+    BulkDownloadRequest,
+    SearchResponse,
+    PackageDiffResponse,
+    VerifyResponse,
+    StatsResponse
 )
 from utils import (
     generate_package_id,
     create_package_archive,
-    get_package_metadata_from_file,
-    validate_pip_dependencies
+    load_package_metadata,
+    diff_package_files,
+    validate_pip_dependencies,
+    iter_bulk_archive,
+    find_package_file
 )
+from ratelimit import RateLimiter, RateLimitExceeded
+from middleware import BodySizeLimitMiddleware
+from signing import load_signing_key, sign_download, verify_download
+from search import SearchIndex
+from aio import run_io, map_io
+from stats import PackageStats
+from integrity import ArchiveScrubber, read_scrub_failures, verify_package_archive
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm the indexes and start the archive scrubber once the server is up"""
+    search_index.schedule_sync(get_packages_dir())
+    package_stats.schedule_sync(get_packages_dir())
+    scrubber.start()
+    yield
+    scrubber.stop()
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="ReproPack",
     description="Package software development environments for reproducible setups",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 """Runtime configuration
@@ -32,6 +62,22 @@ Environment variables:
   REPROPACK_CORS_ORIGINS  Comma-separated list of allowed origins. '*' (default) allows all.
   REPROPACK_PACKAGES_DIR  Directory to store generated package archives (default: 'packages').
   PORT                    Port for uvicorn when running via __main__ (Railway provides this).
+  WEB_CONCURRENCY         Number of worker processes when running via __main__ (default: 1).
+  REPROPACK_RELOAD        Set to '1' to enable auto-reload in development (single worker only).
+  REPROPACK_SENDFILE_MODE Hand downloads to the front web server instead of streaming them
+                          from Python: 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache,
+                          lighttpd, Caddy). Empty (default) serves files directly.
+  REPROPACK_ACCEL_REDIRECT_PREFIX  Internal nginx location mapped to the packages directory
+                          (default: '/protected-packages/').
+  REPROPACK_SIGNED_URL_MAX_TTL     Longest lifetime in seconds for signed download URLs (default: 86400).
+
+Importing this module does no filesystem work: the packages directory, the
+signing key and the search index are all set up on first use, which keeps
+cold starts short.
+
+Several workers (or replicas on one volume) may share REPROPACK_PACKAGES_DIR:
+archives are published atomically with hard links that fail rather than
+overwrite an existing archive, so no in-process state needs to be shared.
 """
 
 raw_origins = os.getenv("REPROPACK_CORS_ORIGINS", "*")
@@ -43,6 +89,10 @@ if "*" in ALLOWED_ORIGINS:
 else:
     cors_origins = ALLOWED_ORIGINS
 
+# Cap request bodies while they stream in (REPROPACK_MAX_BODY_BYTES); added
+# before CORS so 413 responses still carry CORS headers
+app.add_middleware(BodySizeLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=cors_origins,
@@ -53,7 +103,36 @@ app.add_middleware(
 
 # Packages directory (can be backed by a Railway volume mount like /data)
 PACKAGES_DIR = os.getenv("REPROPACK_PACKAGES_DIR", "packages")
-os.makedirs(PACKAGES_DIR, exist_ok=True)
+
+
+@lru_cache(maxsize=None)
+def get_packages_dir() -> str:
+    """Return PACKAGES_DIR, creating it on first use rather than at import"""
+    os.makedirs(PACKAGES_DIR, exist_ok=True)
+    return PACKAGES_DIR
+
+
+# Download offloading and signed URLs
+SENDFILE_MODE = os.getenv("REPROPACK_SENDFILE_MODE", "").strip().lower()
+ACCEL_REDIRECT_PREFIX = os.getenv("REPROPACK_ACCEL_REDIRECT_PREFIX", "/protected-packages/")
+SIGNED_URL_MAX_TTL = int(os.getenv("REPROPACK_SIGNED_URL_MAX_TTL", "86400"))
+
+
+@lru_cache(maxsize=None)
+def get_signing_key() -> bytes:
+    """Load (or create) the URL signing key on first use"""
+    return load_signing_key(get_packages_dir())
+
+
+# Search index and statistics, updated in the background as packages are created
+search_index = SearchIndex()
+package_stats = PackageStats()
+
+# Background integrity checks (off unless REPROPACK_SCRUB_INTERVAL_SECONDS is set)
+scrubber = ArchiveScrubber(PACKAGES_DIR)
+
+# Creation rate limits and per-author quotas (see ratelimit.py for settings)
+rate_limiter = RateLimiter.from_env(PACKAGES_DIR)
 
 
 @app.get("/")
@@ -66,40 +145,67 @@ async def root():
         "endpoints": {
             "create_package": "POST /create-package",
             "download_package": "GET /download-package/{package_id}",
-            "list_packages": "GET /list-packages"
+            "download_packages": "POST /download-packages",
+            "download_url": "GET /download-url/{package_id}",
+            "list_packages": "GET /list-packages",
+            "search": "GET /search",
+            "diff": "GET /diff/{id_a}/{id_b}",
+            "verify": "GET /verify/{package_id}",
+            "stats": "GET /stats"
         }
     }
 
 
 @app.post("/create-package", response_model=PackageResponse)
-async def create_package(request: CreatePackageRequest):
+async def create_package(request: CreatePackageRequest, http_request: Request):
     """
     Create a new package with project dependencies, environment variables, 
     setup scripts, and optional dataset links.
     """
     try:
-        # Validate dependencies format
-        if request.dependencies:
-            validation_errors = validate_pip_dependencies(request.dependencies)
-            if validation_errors:
-                # Raise 400 preserving message
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Invalid dependency format: {'; '.join(validation_errors)}"
-                )
-
-        # Generate unique package ID
-        package_id = generate_package_id()
-
-        # Create package archive
-        package_path, file_size = create_package_archive(request, package_id, PACKAGES_DIR)
+        # Enforce rate limits and quotas before spending any CPU or disk
+        client_host = http_request.client.host if http_request.client else "unknown"
+        try:
+            await run_in_threadpool(rate_limiter.check, client_host, request.author)
+        except RateLimitExceeded as exc:
+            raise HTTPException(
+                status_code=429,
+                detail=exc.detail,
+                headers={"Retry-After": RateLimiter.retry_after_header(exc.retry_after)}
+            )
+
+        try:
+            # Validate dependencies format
+            if request.dependencies:
+                validation_errors = validate_pip_dependencies(request.dependencies)
+                if validation_errors:
+                    # Raise 400 preserving message
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Invalid dependency format: {'; '.join(validation_errors)}"
+                    )
+
+            # Generate unique package ID; publishing fails rather than overwrite on a collision
+            package_id = generate_package_id()
+            await run_io(get_packages_dir)  # create the store on first use
+
+            # Create package archive off the event loop; compression is CPU-bound
+            package_path, file_size, digest = await run_in_threadpool(
+                create_package_archive, request, package_id, PACKAGES_DIR, (search_index, package_stats)
+            )
+        except BaseException:
+            # No package was created; give back the quota slot taken by check
+            await run_in_threadpool(rate_limiter.release, request.author)
+            raise
+        await run_in_threadpool(rate_limiter.record, request.author, file_size)
 
         return PackageResponse(
             package_id=package_id,
             project_name=request.project_name,
             created_at=datetime.now(),
             file_path=package_path,
-            file_size=file_size
+            file_size=file_size,
+            sha256=digest
         )
     except HTTPException as http_exc:
         # Re-raise FastAPI HTTP errors (e.g., 400 validation)
@@ -109,6 +215,25 @@ async def create_package(request: CreatePackageRequest):
         raise HTTPException(status_code=500, detail=f"Failed to create package: {str(e)}")
 
 
+def _package_file_response(package_filename: str) -> Response:
+    """Serve a package archive, delegating the byte transfer to the web server when configured"""
+    package_path = os.path.join(PACKAGES_DIR, package_filename)
+    headers = {"Content-Disposition": f"attachment; filename*=utf-8''{quote(package_filename)}"}
+
+    if SENDFILE_MODE == "x-accel-redirect":
+        headers["X-Accel-Redirect"] = ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + quote(package_filename)
+        return Response(media_type='application/zip', headers=headers)
+    if SENDFILE_MODE == "x-sendfile":
+        headers["X-Sendfile"] = quote(os.path.abspath(package_path))
+        return Response(media_type='application/zip', headers=headers)
+
+    return FileResponse(
+        path=package_path,
+        filename=package_filename,
+        media_type='application/zip'
+    )
+
+
 @app.get("/download-package/{package_id}")
 async def download_package(package_id: str):
     """
@@ -116,22 +241,12 @@ async def download_package(package_id: str):
     """
     try:
         # Find package file by ID
-        package_files = [f for f in os.listdir(PACKAGES_DIR) if package_id in f and f.endswith('.zip')]
+        package_filename = await run_io(_find_package, package_id)
         
-        if not package_files:
+        if not package_filename:
             raise HTTPException(status_code=404, detail="Package not found")
         
-        package_filename = package_files[0]
-        package_path = os.path.join(PACKAGES_DIR, package_filename)
-        
-        if not os.path.exists(package_path):
-            raise HTTPException(status_code=404, detail="Package file not found")
-        
-        return FileResponse(
-            path=package_path,
-            filename=package_filename,
-            media_type='application/zip'
-        )
+        return _package_file_response(package_filename)
         
     except HTTPException:
         raise
@@ -139,55 +254,186 @@ async def download_package(package_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to download package: {str(e)}")
 
 
+@app.get("/download-url/{package_id}")
+async def download_url(package_id: str, expires_in: int = Query(300, ge=1)):
+    """
+    Issue a short-lived signed URL for downloading a package.
+    """
+    if expires_in > SIGNED_URL_MAX_TTL:
+        raise HTTPException(
+            status_code=400,
+            detail=f"expires_in must not exceed {SIGNED_URL_MAX_TTL} seconds"
+        )
+    if not await run_io(_find_package, package_id):
+        raise HTTPException(status_code=404, detail="Package not found")
+
+    expires = int(time.time()) + expires_in
+    signature = sign_download(await run_io(get_signing_key), package_id, expires)
+    return {
+        "url": f"/signed-download/{package_id}?expires={expires}&signature={signature}",
+        "expires_at": datetime.fromtimestamp(expires).isoformat()
+    }
+
+
+@app.get("/signed-download/{package_id}")
+async def signed_download(package_id: str, expires: int, signature: str):
+    """
+    Download a package through a URL issued by /download-url.
+    """
+    if not verify_download(await run_io(get_signing_key), package_id, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired download URL")
+
+    package_filename = await run_io(_find_package, package_id)
+    if not package_filename:
+        raise HTTPException(status_code=404, detail="Package not found")
+
+    return _package_file_response(package_filename)
+
+
+def _as_local_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """Normalize a datetime for comparison with naive local metadata timestamps"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def _select_bulk_packages(request: BulkDownloadRequest) -> List[str]:
+    """Resolve a bulk download request to a sorted list of package paths"""
+    wanted_ids = set(request.package_ids)
+    created_after = _as_local_naive(request.created_after)
+    created_before = _as_local_naive(request.created_before)
+    needs_metadata = (
+        request.project_name is not None
+        or created_after is not None
+        or created_before is not None
+    )
+
+    selected = []
+    # Sorted order keeps member order stable so clients can resume
+    for filename in sorted(os.listdir(get_packages_dir())):
+        if not filename.endswith('.zip'):
+            continue
+        if request.resume_after is not None and filename <= request.resume_after:
+            continue
+
+        package_id = filename.replace('.zip', '').split('_')[-1]
+        if wanted_ids and package_id not in wanted_ids:
+            continue
+
+        package_path = os.path.join(PACKAGES_DIR, filename)
+        if needs_metadata:
+            metadata = load_package_metadata(package_path) or {}
+            if request.project_name is not None and metadata.get("project_name") != request.project_name:
+                continue
+            if "created_at" in metadata:
+                created_at = datetime.fromisoformat(metadata["created_at"])
+            else:
+                created_at = datetime.fromtimestamp(os.stat(package_path).st_ctime)
+            if created_after is not None and created_at < created_after:
+                continue
+            if created_before is not None and created_at >= created_before:
+                continue
+
+        selected.append(package_path)
+
+    return selected
+
+
+@app.post("/download-packages")
+async def download_packages(request: BulkDownloadRequest):
+    """
+    Stream many packages back as a single tar or zip archive.
+
+    Members are named after their package file and emitted in file name order;
+    pass the last fully received member as `resume_after` to continue an
+    interrupted transfer.
+    """
+    try:
+        package_paths = await run_io(_select_bulk_packages, request)
+
+        if not package_paths:
+            raise HTTPException(status_code=404, detail="No packages matched the request")
+
+        media_type = "application/x-tar" if request.format == "tar" else "application/zip"
+        return StreamingResponse(
+            iter_bulk_archive(package_paths, request.format),
+            media_type=media_type,
+            headers={
+                "Content-Disposition": f'attachment; filename="repropack-packages.{request.format}"',
+                "X-ReproPack-Member-Count": str(len(package_paths)),
+            }
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to download packages: {str(e)}")
+
+
+def _list_package_files() -> List[str]:
+    """Archive file names currently in the store"""
+    return [f for f in os.listdir(get_packages_dir()) if f.endswith('.zip')]
+
+
+def _find_package(package_id: str) -> Optional[str]:
+    return find_package_file(get_packages_dir(), package_id)
+
+
+def _read_package_entry(filename: str) -> Optional[PackageMetadata]:
+    """Build the listing entry for one archive (blocking; run via aio)"""
+    package_path = os.path.join(PACKAGES_DIR, filename)
+    
+    # Get file stats
+    try:
+        file_stats = os.stat(package_path)
+    except FileNotFoundError:
+        # Removed since the directory was listed
+        return None
+    file_size = file_stats.st_size
+    created_at = datetime.fromtimestamp(file_stats.st_ctime)
+    
+    # Try to get metadata from the package
+    metadata = load_package_metadata(package_path)
+    
+    if metadata:
+        return PackageMetadata(
+            package_id=metadata["package_id"],
+            project_name=metadata["project_name"],
+            author=metadata["author"],
+            description=metadata.get("description"),
+            created_at=datetime.fromisoformat(metadata["created_at"]),
+            dependencies_count=len(metadata.get("dependencies", [])),
+            file_size=file_size,
+            file_name=filename
+        )
+
+    # Fallback metadata extraction from filename
+    package_id = filename.replace('.zip', '').split('_')[-1]
+    project_name = filename.replace('.zip', '').replace(f'_{package_id}', '')
+    
+    return PackageMetadata(
+        package_id=package_id,
+        project_name=project_name,
+        author="Unknown",
+        description="No metadata available",
+        created_at=created_at,
+        dependencies_count=0,
+        file_size=file_size,
+        file_name=filename
+    )
+
+
 @app.get("/list-packages", response_model=PackageListResponse)
 async def list_packages():
     """
     List all created packages with metadata.
     """
     try:
-        packages = []
-        
-        # Scan packages directory
-        for filename in os.listdir(PACKAGES_DIR):
-            if filename.endswith('.zip'):
-                package_path = os.path.join(PACKAGES_DIR, filename)
-                
-                # Get file stats
-                file_stats = os.stat(package_path)
-                file_size = file_stats.st_size
-                created_at = datetime.fromtimestamp(file_stats.st_ctime)
-                
-                # Try to get metadata from the package
-                metadata = get_package_metadata_from_file(package_path)
-                
-                if metadata:
-                    package_metadata = PackageMetadata(
-                        package_id=metadata["package_id"],
-                        project_name=metadata["project_name"],
-                        author=metadata["author"],
-                        description=metadata.get("description"),
-                        created_at=datetime.fromisoformat(metadata["created_at"]),
-                        dependencies_count=len(metadata.get("dependencies", [])),
-                        file_size=file_size,
-                        file_name=filename
-                    )
-                else:
-                    # Fallback metadata extraction from filename
-                    package_id = filename.replace('.zip', '').split('_')[-1]
-                    project_name = filename.replace('.zip', '').replace(f'_{package_id}', '')
-                    
-                    package_metadata = PackageMetadata(
-                        package_id=package_id,
-                        project_name=project_name,
-                        author="Unknown",
-                        description="No metadata available",
-                        created_at=created_at,
-                        dependencies_count=0,
-                        file_size=file_size,
-                        file_name=filename
-                    )
-                
-                packages.append(package_metadata)
+        # Scan packages directory, then stat and read metadata concurrently
+        # (bounded by REPROPACK_IO_CONCURRENCY) off the event loop
+        filenames = await run_io(_list_package_files)
+        entries = await map_io(_read_package_entry, filenames)
+        packages = [entry for entry in entries if entry is not None]
         
         # Sort by creation date (newest first)
         packages.sort(key=lambda x: x.created_at, reverse=True)
@@ -201,6 +447,93 @@ async def list_packages():
         raise HTTPException(status_code=500, detail=f"Failed to list packages: {str(e)}")
 
 
+@app.get("/search", response_model=SearchResponse)
+async def search_packages(
+    q: Optional[str] = None,
+    dependency: Optional[str] = None,
+    version: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=1000)
+):
+    """
+    Search packages by text prefix and by dependency version range.
+
+    `q` matches project names, descriptions, dependency names, environment
+    variable keys and dataset links; every term must match as a prefix.
+    `dependency` with an optional `version` specifier (e.g. `<2`) finds
+    packages whose declared range for that dependency overlaps it.
+    """
+    if version and not dependency:
+        raise HTTPException(status_code=400, detail="version requires a dependency")
+
+    try:
+        await run_in_threadpool(search_index.warm, get_packages_dir())
+        results = search_index.search(q, dependency, version, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return SearchResponse(results=results, total_count=len(results))
+
+
+@app.get("/diff/{id_a}/{id_b}", response_model=PackageDiffResponse)
+async def diff_packages(id_a: str, id_b: str):
+    """
+    Compare the environments of two packages.
+
+    Only the metadata of each package is read (and cached), never the full
+    archive; results are memoized per pair since packages are immutable.
+    """
+    try:
+        filename_a = await run_io(_find_package, id_a)
+        filename_b = await run_io(_find_package, id_b)
+        if not filename_a or not filename_b:
+            raise HTTPException(status_code=404, detail="Package not found")
+
+        diff = await run_io(diff_package_files, PACKAGES_DIR, filename_a, filename_b)
+        if diff is None:
+            raise HTTPException(status_code=422, detail="Package metadata is missing or unreadable")
+
+        return diff
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to diff packages: {str(e)}")
+
+
+@app.get("/stats", response_model=StatsResponse)
+async def get_stats(top: int = Query(20, ge=1, le=1000)):
+    """
+    Store-wide aggregates: counts and bytes per project and author, the most
+    common dependencies, and creation counts per day and hour.
+
+    The aggregates are adjusted on every create (and on removals picked up by
+    the background rescan), so this never walks the store.
+    """
+    await run_in_threadpool(package_stats.warm, get_packages_dir())
+    return package_stats.snapshot(top)
+
+
+@app.get("/verify/{package_id}", response_model=VerifyResponse)
+async def verify_package(package_id: str):
+    """
+    Check a package against its recorded archive digest and member manifest.
+    """
+    try:
+        package_filename = await run_io(_find_package, package_id)
+        if not package_filename:
+            raise HTTPException(status_code=404, detail="Package not found")
+
+        result = await run_io(
+            verify_package_archive, os.path.join(PACKAGES_DIR, package_filename)
+        )
+        return VerifyResponse(package_id=package_id, **result)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to verify package: {str(e)}")
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -208,7 +541,8 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "packages_directory": PACKAGES_DIR,
-        "packages_count": len([f for f in os.listdir(PACKAGES_DIR) if f.endswith('.zip')])
+        "packages_count": len(await run_io(_list_package_files)),
+        "integrity_failures": sorted(await run_io(read_scrub_failures, PACKAGES_DIR)) if scrubber.enabled else None
     }
 
 
@@ -216,4 +550,6 @@ if __name__ == "__main__":
     import uvicorn
     # Use PORT env var if provided (Koyeb, Render, etc.) else default 8000
     port = int(os.getenv("PORT", "8000"))
-    uvicorn.run(app, host="0.0.0.0", port=port, reload=True)
+    reload = os.getenv("REPROPACK_RELOAD", "0") == "1"
+    workers = 1 if reload else int(os.getenv("WEB_CONCURRENCY", "1"))
+    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=reload, workers=workers)
@@ -0,0 +1,84 @@
+"""ASGI middleware for the ReproPack API
+
+Environment variables:
+  REPROPACK_MAX_BODY_BYTES  Largest accepted request body in bytes (default: 1048576).
+"""
+
+import json
+import os
+from typing import Optional
+
+
+DEFAULT_MAX_BODY_BYTES = 1024 * 1024
+
+
+class BodySizeLimitMiddleware:
+    """Reject oversized request bodies with 413 while they are being received
+
+    A declared Content-Length over the limit is refused before the app runs.
+    Otherwise received bytes are counted as they arrive, and once the limit is
+    crossed the client gets 413 and the app sees a disconnect, so it never
+    buffers or parses the rest of the body.
+    """
+
+    def __init__(self, app, max_body_bytes: Optional[int] = None):
+        self.app = app
+        if max_body_bytes is None:
+            max_body_bytes = int(os.getenv("REPROPACK_MAX_BODY_BYTES", str(DEFAULT_MAX_BODY_BYTES)))
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_body_bytes <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    break
+                if declared > self.max_body_bytes:
+                    await self._reject(send)
+                    return
+                break
+
+        state = {"received": 0, "rejected": False, "response_started": False}
+
+        async def limited_receive():
+            if state["rejected"]:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                state["received"] += len(message.get("body", b""))
+                if state["received"] > self.max_body_bytes:
+                    state["rejected"] = True
+                    if not state["response_started"]:
+                        await self._reject(send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            if state["rejected"]:
+                # The 413 has already been sent; drop whatever the app produces
+                return
+            if message["type"] == "http.response.start":
+                state["response_started"] = True
+            await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
+
+    async def _reject(self, send):
+        body = json.dumps({
+            "detail": f"Request body exceeds the {self.max_body_bytes} byte limit"
+        }).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
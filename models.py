@@ -1,12 +1,32 @@
+import os
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Literal, Annotated
 from datetime import datetime
 
 
+def _limit(name: str, default: int) -> int:
+    """Read a size limit from the environment (REPROPACK_MAX_*)"""
+    return int(os.getenv(name, str(default)))
+
+
+# Field-level caps for CreatePackageRequest; the request body as a whole is
+# also capped by REPROPACK_MAX_BODY_BYTES before it is parsed (see middleware.py)
+MAX_NAME_LENGTH = _limit("REPROPACK_MAX_NAME_LENGTH", 256)
+MAX_TEXT_LENGTH = _limit("REPROPACK_MAX_TEXT_LENGTH", 20000)
+MAX_ITEM_LENGTH = _limit("REPROPACK_MAX_ITEM_LENGTH", 4096)
+MAX_DEPENDENCIES = _limit("REPROPACK_MAX_DEPENDENCIES", 1000)
+MAX_ENVIRONMENT_VARIABLES = _limit("REPROPACK_MAX_ENVIRONMENT_VARIABLES", 500)
+MAX_SETUP_SCRIPTS = _limit("REPROPACK_MAX_SETUP_SCRIPTS", 200)
+MAX_DATASET_LINKS = _limit("REPROPACK_MAX_DATASET_LINKS", 200)
+
+NameStr = Annotated[str, Field(max_length=MAX_NAME_LENGTH)]
+ItemStr = Annotated[str, Field(max_length=MAX_ITEM_LENGTH)]
+
+
 class DependencyModel(BaseModel):
     """Model for project dependencies following pip freeze style"""
-    name: str = Field(..., description="Package name")
-    version: str = Field(..., description="Package version (e.g., '1.0.0', '>=1.0.0')")
+    name: str = Field(..., max_length=MAX_NAME_LENGTH, description="Package name")
+    version: str = Field(..., max_length=MAX_NAME_LENGTH, description="Package version (e.g., '1.0.0', '>=1.0.0')")
     
     def to_pip_format(self) -> str:
         """Convert to pip freeze format"""
@@ -15,14 +35,26 @@ class DependencyModel(BaseModel):
 
 class CreatePackageRequest(BaseModel):
     """Request model for creating a new package"""
-    project_name: str = Field(..., description="Name of the project")
-    author: str = Field(..., description="Author of the project")
-    description: Optional[str] = Field(None, description="Project description")
-    dependencies: List[DependencyModel] = Field(default_factory=list, description="Project dependencies")
-    environment_variables: Dict[str, str] = Field(default_factory=dict, description="Required environment variables")
-    setup_scripts: List[str] = Field(default_factory=list, description="Setup scripts to run")
-    dataset_links: List[str] = Field(default_factory=list, description="Optional dataset download links")
-    instructions: Optional[str] = Field(None, description="Additional setup instructions")
+    project_name: str = Field(..., max_length=MAX_NAME_LENGTH, description="Name of the project")
+    author: str = Field(..., max_length=MAX_NAME_LENGTH, description="Author of the project")
+    description: Optional[str] = Field(None, max_length=MAX_TEXT_LENGTH, description="Project description")
+    dependencies: List[DependencyModel] = Field(
+        default_factory=list, max_length=MAX_DEPENDENCIES, description="Project dependencies"
+    )
+    environment_variables: Dict[NameStr, ItemStr] = Field(
+        default_factory=dict, max_length=MAX_ENVIRONMENT_VARIABLES, description="Required environment variables"
+    )
+    setup_scripts: List[ItemStr] = Field(
+        default_factory=list, max_length=MAX_SETUP_SCRIPTS, description="Setup scripts to run"
+    )
+    dataset_links: List[ItemStr] = Field(
+        default_factory=list, max_length=MAX_DATASET_LINKS, description="Optional dataset download links"
+    )
+    instructions: Optional[str] = Field(None, max_length=MAX_TEXT_LENGTH, description="Additional setup instructions")
+    output_formats: List[Literal["dockerfile", "conda", "devcontainer"]] = Field(
+        default_factory=list,
+        description="Extra setup files to render: Dockerfile, conda environment.yml, .devcontainer config"
+    )
 
 
 class PackageResponse(BaseModel):
@@ -32,6 +64,7 @@ class PackageResponse(BaseModel):
     created_at: datetime = Field(..., description="Package creation timestamp")
     file_path: str = Field(..., description="Path to the package file")
     file_size: int = Field(..., description="Size of the package file in bytes")
+    sha256: Optional[str] = Field(None, description="SHA-256 digest of the package file")
 
 
 class PackageMetadata(BaseModel):
@@ -50,3 +83,113 @@ class PackageListResponse(BaseModel):
     """Response model for listing packages"""
     packages: List[PackageMetadata] = Field(..., description="List of package metadata")
     total_count: int = Field(..., description="Total number of packages")
+
+
+class BulkDownloadRequest(BaseModel):
+    """Request model for downloading many packages as one streamed archive"""
+    package_ids: List[str] = Field(default_factory=list, description="Package IDs to include (empty selects all)")
+    project_name: Optional[str] = Field(None, description="Only include packages for this project")
+    created_after: Optional[datetime] = Field(None, description="Only include packages created at or after this time")
+    created_before: Optional[datetime] = Field(None, description="Only include packages created before this time")
+    format: Literal["tar", "zip"] = Field("tar", description="Container format of the streamed archive")
+    resume_after: Optional[str] = Field(None, description="Skip members up to and including this file name")
+
+
+class SearchResult(BaseModel):
+    """A package matching a search query"""
+    package_id: str = Field(..., description="Unique package identifier")
+    project_name: str = Field(..., description="Name of the project")
+    file_name: str = Field(..., description="Name of the package file")
+    dependency_version: Optional[str] = Field(None, description="Declared version of the searched dependency")
+
+
+class SearchResponse(BaseModel):
+    """Response model for package search"""
+    results: List[SearchResult] = Field(..., description="Matching packages")
+    total_count: int = Field(..., description="Number of results returned")
+
+
+class FieldChange(BaseModel):
+    """A changed top-level package field"""
+    field: str = Field(..., description="Field name")
+    old: Optional[str] = Field(None, description="Value in the first package")
+    new: Optional[str] = Field(None, description="Value in the second package")
+
+
+class DependencyChange(BaseModel):
+    """A dependency that was added, removed or re-versioned"""
+    name: str = Field(..., description="Package name")
+    old_version: Optional[str] = Field(None, description="Version in the first package (null if added)")
+    new_version: Optional[str] = Field(None, description="Version in the second package (null if removed)")
+
+
+class EnvironmentVariableChange(BaseModel):
+    """An environment variable that was added, removed or changed"""
+    key: str = Field(..., description="Variable name")
+    old_value: Optional[str] = Field(None, description="Value in the first package (null if added)")
+    new_value: Optional[str] = Field(None, description="Value in the second package (null if removed)")
+
+
+class ListChange(BaseModel):
+    """Items added to and removed from a list field"""
+    added: List[str] = Field(default_factory=list, description="Items only in the second package")
+    removed: List[str] = Field(default_factory=list, description="Items only in the first package")
+
+
+class ScriptChange(ListChange):
+    """Setup script changes, including pure reordering"""
+    reordered: bool = Field(False, description="Same scripts, different order")
+
+
+class PackageDiffResponse(BaseModel):
+    """Response model for comparing two packages"""
+    package_a: str = Field(..., description="First package identifier")
+    package_b: str = Field(..., description="Second package identifier")
+    identical: bool = Field(..., description="Whether the two environments are the same")
+    fields: List[FieldChange] = Field(..., description="Changed top-level fields")
+    dependencies: List[DependencyChange] = Field(..., description="Dependency changes")
+    environment_variables: List[EnvironmentVariableChange] = Field(..., description="Environment variable changes")
+    setup_scripts: ScriptChange = Field(..., description="Setup script changes")
+    dataset_links: ListChange = Field(..., description="Dataset link changes")
+    output_formats: ListChange = Field(..., description="Extra output format changes")
+
+
+class MemberCheck(BaseModel):
+    """Verification result for one archive member"""
+    name: str = Field(..., description="Member file name")
+    ok: bool = Field(..., description="Whether the member matches its manifest hash")
+
+
+class VerifyResponse(BaseModel):
+    """Response model for package integrity verification"""
+    package_id: str = Field(..., description="Unique package identifier")
+    ok: bool = Field(..., description="Whether every available check passed")
+    archive_sha256: str = Field(..., description="Digest of the archive as stored now")
+    recorded_sha256: Optional[str] = Field(None, description="Digest recorded at creation (null for legacy packages)")
+    has_manifest: bool = Field(..., description="Whether the archive carries a per-member manifest")
+    members: List[MemberCheck] = Field(..., description="Per-member results")
+    errors: List[str] = Field(..., description="Problems found")
+    checked_at: datetime = Field(..., description="When the check ran")
+
+
+class AggregateModel(BaseModel):
+    """Package count and total archive size for one group"""
+    count: int = Field(..., description="Number of packages")
+    bytes: int = Field(..., description="Total size of the package files in bytes")
+
+
+class DependencyCount(BaseModel):
+    """How many packages declare a dependency"""
+    name: str = Field(..., description="Normalized dependency name")
+    count: int = Field(..., description="Number of packages declaring it")
+
+
+class StatsResponse(BaseModel):
+    """Response model for store statistics"""
+    total_packages: int = Field(..., description="Number of packages in the store")
+    total_bytes: int = Field(..., description="Total size of all package files in bytes")
+    projects: Dict[str, AggregateModel] = Field(..., description="Aggregates per project name")
+    authors: Dict[str, AggregateModel] = Field(..., description="Aggregates per author")
+    top_dependencies: List[DependencyCount] = Field(..., description="Most common dependencies")
+    created_per_day: Dict[str, int] = Field(..., description="Packages created per day (YYYY-MM-DD)")
+    created_per_hour: Dict[str, int] = Field(..., description="Packages created per hour over the last 48 hours")
@@ -0,0 +1,306 @@
+"""Rate limiting and per-author quotas for package creation
+
+Environment variables:
+  REPROPACK_RATE_LIMIT_PER_MINUTE  Sustained creates per minute, per client and per author (0 disables, default).
+  REPROPACK_RATE_LIMIT_BURST       Token bucket capacity (default: same as the per-minute rate).
+  REPROPACK_QUOTA_MAX_PACKAGES     Packages an author may create per quota window (0 = unlimited, default).
+  REPROPACK_QUOTA_MAX_BYTES        Archive bytes an author may create per quota window (0 = unlimited, default).
+  REPROPACK_QUOTA_WINDOW_SECONDS   Length of the quota window (default: 86400).
+  REPROPACK_RATE_LIMIT_BACKEND     'sqlite' (shared by all workers on the host), 'memory' (per process) or
+                                   'auto' (default: sqlite whenever a rate limit or quota is set, so limits
+                                   hold across WEB_CONCURRENCY workers).
+  REPROPACK_RATE_LIMIT_DB          SQLite file for the shared backend (default: <packages dir>/.ratelimit.sqlite3).
+"""
+
+import os
+import math
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a caller is over a rate limit or quota"""
+
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def _refill(tokens: float, updated: float, now: float, rate: float, capacity: float) -> float:
+    """Return the bucket level after refilling at ``rate`` tokens per second"""
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+
+class MemoryBackend:
+    """Bucket and quota state kept in this process only"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._usage: Dict[Tuple[str, int], Tuple[int, int]] = {}
+        self._next_sweep = 0.0
+        self._window_start: Optional[int] = None
+
+    def take(self, keys: Tuple[str, ...], rate: float, capacity: float, now: float) -> Tuple[Optional[str], float]:
+        """Take one token from every bucket, or from none
+
+        Returns (None, 0) on success, or the first empty bucket's key and the
+        seconds until it has a token.
+        """
+        with self._lock:
+            if now >= self._next_sweep:
+                # A bucket untouched for a full refill period is back at
+                # capacity, which is the same as having no bucket at all
+                refill_seconds = capacity / rate
+                self._buckets = {
+                    k: v for k, v in self._buckets.items() if now - v[1] < refill_seconds
+                }
+                self._next_sweep = now + refill_seconds
+            levels = {}
+            for key in keys:
+                tokens, updated = self._buckets.get(key, (capacity, now))
+                levels[key] = _refill(tokens, updated, now, rate, capacity)
+                if levels[key] < 1:
+                    return key, (1 - levels[key]) / rate
+            for key, tokens in levels.items():
+                self._buckets[key] = (tokens - 1, now)
+            return None, 0.0
+
+    def _roll_window(self, window_start: int) -> None:
+        # Forget windows that have rolled over, for every key
+        if self._window_start is None or window_start > self._window_start:
+            self._usage = {k: v for k, v in self._usage.items() if k[1] >= window_start}
+            self._window_start = window_start
+
+    def usage(self, key: str, window_start: int) -> Tuple[int, int]:
+        with self._lock:
+            self._roll_window(window_start)
+            return self._usage.get((key, window_start), (0, 0))
+
+    def reserve(self, key: str, window_start: int, max_packages: int, max_bytes: int) -> bool:
+        """Atomically count one more package unless the key is at its quota"""
+        with self._lock:
+            self._roll_window(window_start)
+            count, total = self._usage.get((key, window_start), (0, 0))
+            if (max_packages and count >= max_packages) or (max_bytes and total >= max_bytes):
+                return False
+            self._usage[(key, window_start)] = (count + 1, total)
+            return True
+
+    def release(self, key: str, window_start: int) -> None:
+        with self._lock:
+            count, total = self._usage.get((key, window_start), (0, 0))
+            if count > 0:
+                self._usage[(key, window_start)] = (count - 1, total)
+
+    def add_bytes(self, key: str, window_start: int, size: int) -> None:
+        with self._lock:
+            count, total = self._usage.get((key, window_start), (0, 0))
+            self._usage[(key, window_start)] = (count, total + size)
+
+
+class SQLiteBackend:
+    """Bucket and quota state shared through a local SQLite file
+
+    Every worker process on the host that points at the same file sees the
+    same buckets and quota counters. The file must be on a local filesystem:
+    SQLite's WAL mode does not work over network filesystems.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._next_sweep = 0.0
+        self._window_start: Optional[int] = None
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Imported and opened on first use so startup does no I/O
+            import sqlite3
+
+            # The default path lives in the packages directory, which is
+            # itself created lazily and may not exist yet
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS buckets_updated ON buckets (updated)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                "key TEXT, window_start INTEGER, count INTEGER, bytes INTEGER, "
+                "PRIMARY KEY (key, window_start))"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, work):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def take(self, keys: Tuple[str, ...], rate: float, capacity: float, now: float) -> Tuple[Optional[str], float]:
+        def work(conn) -> Tuple[Optional[str], float]:
+            if now >= self._next_sweep:
+                # Buckets untouched for a full refill period are back at capacity
+                conn.execute("DELETE FROM buckets WHERE updated <= ?", (now - capacity / rate,))
+                self._next_sweep = now + capacity / rate
+            levels = {}
+            for key in keys:
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated = row if row else (capacity, now)
+                levels[key] = _refill(tokens, updated, now, rate, capacity)
+                if levels[key] < 1:
+                    return key, (1 - levels[key]) / rate
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                [(key, tokens - 1, now) for key, tokens in levels.items()]
+            )
+            return None, 0.0
+
+        return self._transaction(work)
+
+    def _roll_window(self, conn, window_start: int) -> None:
+        # Forget windows that have rolled over, for every key
+        if self._window_start is None or window_start > self._window_start:
+            conn.execute("DELETE FROM usage WHERE window_start < ?", (window_start,))
+            self._window_start = window_start
+
+    def usage(self, key: str, window_start: int) -> Tuple[int, int]:
+        def work(conn) -> Tuple[int, int]:
+            self._roll_window(conn, window_start)
+            row = conn.execute(
+                "SELECT count, bytes FROM usage WHERE key = ? AND window_start = ?", (key, window_start)
+            ).fetchone()
+            return (row[0], row[1]) if row else (0, 0)
+
+        return self._transaction(work)
+
+    def reserve(self, key: str, window_start: int, max_packages: int, max_bytes: int) -> bool:
+        def work(conn) -> bool:
+            self._roll_window(conn, window_start)
+            row = conn.execute(
+                "SELECT count, bytes FROM usage WHERE key = ? AND window_start = ?", (key, window_start)
+            ).fetchone()
+            count, total = row if row else (0, 0)
+            if (max_packages and count >= max_packages) or (max_bytes and total >= max_bytes):
+                return False
+            conn.execute(
+                "INSERT INTO usage (key, window_start, count, bytes) VALUES (?, ?, 1, 0) "
+                "ON CONFLICT (key, window_start) DO UPDATE SET count = count + 1",
+                (key, window_start)
+            )
+            return True
+
+        return self._transaction(work)
+
+    def release(self, key: str, window_start: int) -> None:
+        self._connect().execute(
+            "UPDATE usage SET count = count - 1 WHERE key = ? AND window_start = ? AND count > 0",
+            (key, window_start)
+        )
+
+    def add_bytes(self, key: str, window_start: int, size: int) -> None:
+        self._connect().execute(
+            "INSERT INTO usage (key, window_start, count, bytes) VALUES (?, ?, 0, ?) "
+            "ON CONFLICT (key, window_start) DO UPDATE SET bytes = bytes + excluded.bytes",
+            (key, window_start, size)
+        )
+
+
+class RateLimiter:
+    """Token buckets keyed by client and author, plus per-author quotas"""
+
+    def __init__(
+        self,
+        backend=None,
+        rate_per_minute: float = 0,
+        burst: Optional[float] = None,
+        max_packages: int = 0,
+        max_bytes: int = 0,
+        window_seconds: int = 86400
+    ):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst if burst else max(1.0, float(rate_per_minute))
+        self.max_packages = max_packages
+        self.max_bytes = max_bytes
+        self.window_seconds = window_seconds
+
+    @classmethod
+    def from_env(cls, packages_dir: str) -> "RateLimiter":
+        """Build a limiter from REPROPACK_RATE_LIMIT_* / REPROPACK_QUOTA_* variables"""
+        limiter = cls(
+            rate_per_minute=float(os.getenv("REPROPACK_RATE_LIMIT_PER_MINUTE", "0")),
+            burst=float(os.getenv("REPROPACK_RATE_LIMIT_BURST", "0")) or None,
+            max_packages=int(os.getenv("REPROPACK_QUOTA_MAX_PACKAGES", "0")),
+            max_bytes=int(os.getenv("REPROPACK_QUOTA_MAX_BYTES", "0")),
+            window_seconds=int(os.getenv("REPROPACK_QUOTA_WINDOW_SECONDS", "86400"))
+        )
+        backend = os.getenv("REPROPACK_RATE_LIMIT_BACKEND", "auto")
+        # Per-process state would multiply every limit by the number of workers
+        if backend == "sqlite" or (backend == "auto" and limiter.enabled):
+            default_db = os.path.join(packages_dir, ".ratelimit.sqlite3")
+            limiter.backend = SQLiteBackend(os.getenv("REPROPACK_RATE_LIMIT_DB", default_db))
+        return limiter
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.rate > 0 or self.max_packages or self.max_bytes)
+
+    def _window_start(self, now: float) -> int:
+        return int(now // self.window_seconds) * self.window_seconds
+
+    def check(self, client: str, author: str, now: Optional[float] = None) -> None:
+        """Admit one package creation or raise RateLimitExceeded
+
+        An admitted creation holds one slot of the author's package quota
+        until ``record`` (or ``release``, if the creation fails), so
+        concurrent creates cannot overshoot it.
+        """
+        now = time.time() if now is None else now
+
+        if self.rate > 0:
+            # Both buckets or neither: a request refused for its author must
+            # not spend the client's token
+            key, retry_after = self.backend.take(
+                (f"client:{client}", f"author:{author}"), self.rate, self.capacity, now
+            )
+            if key is not None:
+                raise RateLimitExceeded(f"Rate limit exceeded for {key}", retry_after)
+
+        if self.max_packages or self.max_bytes:
+            window_start = self._window_start(now)
+            if not self.backend.reserve(f"author:{author}", window_start, self.max_packages, self.max_bytes):
+                raise RateLimitExceeded(
+                    f"Quota exceeded for author '{author}'",
+                    window_start + self.window_seconds - now
+                )
+
+    def record(self, author: str, size: int, now: Optional[float] = None) -> None:
+        """Charge a created package's bytes against the author's quota"""
+        if not (self.max_packages or self.max_bytes):
+            return
+        now = time.time() if now is None else now
+        self.backend.add_bytes(f"author:{author}", self._window_start(now), size)
+
+    def release(self, author: str, now: Optional[float] = None) -> None:
+        """Return the quota slot taken by ``check`` for a creation that failed"""
+        if not (self.max_packages or self.max_bytes):
+            return
+        now = time.time() if now is None else now
+        self.backend.release(f"author:{author}", self._window_start(now))
+
+    @staticmethod
+    def retry_after_header(retry_after: float) -> str:
+        return str(max(1, math.ceil(retry_after)))
@@ -0,0 +1,187 @@
+"""
+Rebuild the package index for an existing store
+
+Walks a packages directory, extracts each archive's metadata across a
+process pool and appends one JSON record per archive to an index file. It also
+backfills the ``<archive>.sha256`` digest sidecar for archives written before
+digests were recorded.
+
+The API reads the index file on startup (see ``indexing.py``) and builds its
+search and stats views from the records instead of opening every archive.
+
+The index file doubles as the checkpoint: records are flushed in batches, and
+a rerun skips archives that already have a record, so an interrupted run
+resumes where it stopped. Once a run finishes, superseded error records and
+records for deleted archives are compacted away. Sidecars are written
+atomically and workers run at lowered CPU priority, so the tool can run while
+the API keeps serving.
+
+Usage:
+  python reindex.py --packages-dir /data/packages --workers 4
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+from typing import Any, Dict, Optional
+
+from utils import get_package_metadata_from_file
+from indexing import INDEX_FILENAME, load_index_records
+from integrity import read_digest_file, sha256_file, write_digest_file
+
+
+def _lower_priority(niceness: int) -> None:
+    """Pool initializer: yield CPU to the API workers"""
+    if niceness and hasattr(os, "nice"):
+        try:
+            os.nice(niceness)
+        except OSError:
+            pass
+
+
+def index_archive(package_path: str, backfill_digests: bool = True) -> Dict[str, Any]:
+    """Build the index record for one archive"""
+    record: Dict[str, Any] = {"file_name": os.path.basename(package_path)}
+    try:
+        record["file_size"] = os.path.getsize(package_path)
+        digest = read_digest_file(package_path)
+        if digest is None:
+            digest = sha256_file(package_path)
+            if backfill_digests:
+                write_digest_file(package_path, digest)
+        record["sha256"] = digest
+        metadata = get_package_metadata_from_file(package_path)
+        if not metadata:
+            raise ValueError("no readable metadata.json")
+        record["package_id"] = metadata["package_id"]
+        record["metadata"] = metadata
+    except Exception as e:
+        # A malformed or foreign archive must not end the run
+        record["error"] = f"{type(e).__name__}: {e}"
+    return record
+
+
+def _index_archive_task(args) -> Dict[str, Any]:
+    return index_archive(*args)
+
+
+def compact_index(index_path: str, on_disk: set) -> bool:
+    """Rewrite the index with one record per existing archive; returns whether it changed"""
+    records = load_index_records(index_path)
+    try:
+        with open(index_path, "r", encoding="utf-8") as fh:
+            line_count = sum(1 for _ in fh)
+    except FileNotFoundError:
+        return False
+    kept = [record for name, record in sorted(records.items()) if name in on_disk]
+    if len(kept) == line_count:
+        return False
+    temp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as fh:
+        for record in kept:
+            fh.write(json.dumps(record) + "\n")
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(temp_path, index_path)
+    return True
+
+
+def reindex(
+    packages_dir: str,
+    index_path: Optional[str] = None,
+    workers: Optional[int] = None,
+    batch_size: int = 100,
+    backfill_digests: bool = True,
+    niceness: int = 10,
+    progress_interval: float = 5.0,
+    out=sys.stderr
+) -> Dict[str, Any]:
+    """Index every archive in ``packages_dir`` not yet in ``index_path``"""
+    index_path = index_path or os.path.join(packages_dir, INDEX_FILENAME)
+    done = load_index_records(index_path)
+    on_disk = {entry.name: entry.path for entry in os.scandir(packages_dir) if entry.name.endswith(".zip")}
+    pending = sorted(path for name, path in on_disk.items() if name not in done)
+
+    started = time.monotonic()
+    last_report = started
+    processed = errors = total_bytes = 0
+
+    with open(index_path, "a", encoding="utf-8") as index_file, \
+            Pool(workers, initializer=_lower_priority, initargs=(niceness,)) as pool:
+        tasks = ((path, backfill_digests) for path in pending)
+        for record in pool.imap_unordered(_index_archive_task, tasks, chunksize=16):
+            index_file.write(json.dumps(record) + "\n")
+            processed += 1
+            total_bytes += record.get("file_size", 0)
+            if "error" in record:
+                errors += 1
+
+            if processed % batch_size == 0:
+                index_file.flush()
+                os.fsync(index_file.fileno())
+
+            now = time.monotonic()
+            if out is not None and now - last_report >= progress_interval:
+                elapsed = now - started
+                print(
+                    f"{processed}/{len(pending)} archives "
+                    f"({processed / elapsed:.1f} archives/s, {total_bytes / elapsed / 1e6:.1f} MB/s)",
+                    file=out
+                )
+                last_report = now
+
+        index_file.flush()
+        os.fsync(index_file.fileno())
+
+    compact_index(index_path, set(on_disk))
+
+    elapsed = max(time.monotonic() - started, 1e-9)
+    summary = {
+        "processed": processed,
+        "skipped": len(on_disk.keys() & done.keys()),
+        "errors": errors,
+        "bytes": total_bytes,
+        "seconds": round(elapsed, 3),
+        "archives_per_second": round(processed / elapsed, 1),
+        "index_path": index_path
+    }
+    if out is not None:
+        print(json.dumps(summary), file=out)
+    return summary
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Rebuild the ReproPack package index")
+    parser.add_argument(
+        "--packages-dir",
+        default=os.getenv("REPROPACK_PACKAGES_DIR", "packages"),
+        help="Package store to walk (default: $REPROPACK_PACKAGES_DIR or 'packages')"
+    )
+    parser.add_argument("--index", help=f"Index/checkpoint file (default: <packages-dir>/{INDEX_FILENAME})")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Records between checkpoint fsyncs")
+    parser.add_argument("--nice", type=int, default=10, help="Niceness increment for workers (0 to disable)")
+    parser.add_argument("--no-backfill", action="store_true", help="Do not write missing .sha256 sidecars")
+    parser.add_argument("--restart", action="store_true", help="Discard the checkpoint and index everything")
+    args = parser.parse_args(argv)
+
+    index_path = args.index or os.path.join(args.packages_dir, INDEX_FILENAME)
+    if args.restart and os.path.exists(index_path):
+        os.remove(index_path)
+
+    summary = reindex(
+        args.packages_dir,
+        index_path=index_path,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        backfill_digests=not args.no_backfill,
+        niceness=args.nice
+    )
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""In-memory inverted index over package metadata"""
+
+import bisect
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from indexing import BackgroundIndex
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_VERSION_RE = re.compile(r"\d+(?:\.\d+)*")
+_CLAUSE_RE = re.compile(r"^\s*(===|==|~=|!=|<=|>=|<|>)?\s*(.+?)\s*$")
+
+# An interval bound: (version tuple, inclusive) or None for unbounded
+Bound = Optional[Tuple[Tuple[int, ...], bool]]
+
+
+def tokenize(text: str) -> List[str]:
+    """Split free text into lowercase alphanumeric terms"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def normalize_name(name: str) -> str:
+    """Normalize a distribution name the way pip compares them"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def _release(text: str) -> Optional[Tuple[int, ...]]:
+    """Release segments exactly as written ('1.24.0rc1' -> (1, 24, 0))"""
+    match = _VERSION_RE.search(text)
+    if not match:
+        return None
+    return tuple(int(p) for p in match.group(0).split("."))
+
+
+def _normalize(release: Tuple[int, ...]) -> Tuple[int, ...]:
+    """Drop trailing zeros so '2', '2.0' and '2.0.0' compare equal"""
+    parts = list(release)
+    while len(parts) > 1 and parts[-1] == 0:
+        parts.pop()
+    return tuple(parts)
+
+
+def _bump(release: Tuple[int, ...]) -> Tuple[int, ...]:
+    """The next release at the given precision ((2, 0) -> (2, 1))"""
+    return release[:-1] + (release[-1] + 1,)
+
+
+def parse_version(text: str) -> Optional[Tuple[int, ...]]:
+    """Parse the numeric release part of a version ('1.24.0rc1' -> (1, 24))"""
+    release = _release(text)
+    return _normalize(release) if release is not None else None
+
+
+def _max_lower(a: Bound, b: Bound) -> Bound:
+    """Pick the tighter of two lower bounds"""
+    if a is None:
+        return b
+    if b is None or b[0] < a[0] or (b[0] == a[0] and b[1]):
+        return a
+    return b
+
+
+def _min_upper(a: Bound, b: Bound) -> Bound:
+    """Pick the tighter of two upper bounds"""
+    if a is None:
+        return b
+    if b is None or b[0] > a[0] or (b[0] == a[0] and b[1]):
+        return a
+    return b
+
+
+def _narrow(
+    lower: Bound, upper: Bound, op: str, release: Tuple[int, ...], wildcard: bool = False
+) -> Tuple[Bound, Bound]:
+    """Intersect the interval (lower, upper) with a single specifier clause
+
+    ``release`` is the version's release segments as written; precision
+    matters for '~=' and wildcards, and zeros are dropped only for comparison.
+    """
+    version = _normalize(release)
+    if wildcard:
+        if op in ("", "=="):
+            # ==2.0.* means >=2.0, <2.1
+            return (
+                _max_lower(lower, (version, True)),
+                _min_upper(upper, (_normalize(_bump(release)), False))
+            )
+        # '!=X.*' excludes a range; treat it as unconstrained like '!='
+        return lower, upper
+    if op in ("", "==", "==="):
+        return _max_lower(lower, (version, True)), _min_upper(upper, (version, True))
+    if op == ">=":
+        return _max_lower(lower, (version, True)), upper
+    if op == ">":
+        return _max_lower(lower, (version, False)), upper
+    if op == "<=":
+        return lower, _min_upper(upper, (version, True))
+    if op == "<":
+        return lower, _min_upper(upper, (version, False))
+    if op == "~=":
+        # ~=X.Y means >=X.Y, <X+1 (and ~=X.Y.Z means >=X.Y.Z, <X.Y+1)
+        if len(release) < 2:
+            return _max_lower(lower, (version, True)), upper
+        ceiling = _normalize(_bump(release[:-1]))
+        return _max_lower(lower, (version, True)), _min_upper(upper, (ceiling, False))
+    # '!=' excludes a single point; treat it as unconstrained
+    return lower, upper
+
+
+def version_interval(spec: str) -> Optional[Tuple[Bound, Bound]]:
+    """Turn a specifier such as '>=1.20,<2' or a bare '1.4.0' into an interval"""
+    lower: Bound = None
+    upper: Bound = None
+    for clause in spec.split(","):
+        if not clause.strip():
+            continue
+        match = _CLAUSE_RE.match(clause)
+        release = _release(match.group(2)) if match else None
+        if release is None:
+            return None
+        wildcard = match.group(2).endswith(".*")
+        lower, upper = _narrow(lower, upper, match.group(1) or "", release, wildcard)
+    return lower, upper
+
+
+def intervals_overlap(a: Tuple[Bound, Bound], b: Tuple[Bound, Bound]) -> bool:
+    """Check whether two version intervals share at least one version"""
+    lower = _max_lower(a[0], b[0])
+    upper = _min_upper(a[1], b[1])
+    if lower is None or upper is None:
+        return True
+    return lower[0] < upper[0] or (lower[0] == upper[0] and lower[1] and upper[1])
+
+
+class SearchIndex(BackgroundIndex):
+    """Inverted index of package terms and dependency versions
+
+    Terms come from the project name, description, dependency names,
+    environment variable keys and dataset links.
+    """
+
+    thread_name = "repropack-search-index"
+
+    def __init__(self, refresh_seconds: Optional[float] = None):
+        super().__init__(refresh_seconds)
+        self._postings: Dict[str, Set[str]] = {}
+        self._sorted_terms: List[str] = []
+        self._terms_dirty = False
+        # normalized dependency name -> {package_id: version spec}
+        self._dependencies: Dict[str, Dict[str, str]] = {}
+        self._documents: Dict[str, Dict[str, Any]] = {}
+
+    # -- maintenance -----------------------------------------------------
+
+    def add(self, filename: str, metadata: Dict[str, Any], file_size: int = 0) -> None:
+        package_id = metadata["package_id"]
+        terms = set(tokenize(metadata.get("project_name") or ""))
+        terms.update(tokenize(metadata.get("description") or ""))
+        for key in metadata.get("environment_variables") or {}:
+            terms.update(tokenize(key))
+        for link in metadata.get("dataset_links") or []:
+            terms.update(tokenize(link))
+        dependencies = {}
+        for dep in metadata.get("dependencies") or []:
+            name = normalize_name(dep["name"])
+            dependencies[name] = dep.get("version", "")
+            terms.add(name)
+            terms.update(tokenize(name))
+
+        with self._lock:
+            if filename in self._files:
+                return
+            self._files[filename] = package_id
+            self._documents[package_id] = {
+                "package_id": package_id,
+                "project_name": metadata.get("project_name"),
+                "file_name": filename,
+                "terms": terms,
+                "dependencies": dependencies,
+            }
+            for term in terms:
+                postings = self._postings.setdefault(term, set())
+                if not postings:
+                    self._terms_dirty = True
+                postings.add(package_id)
+            for name, version in dependencies.items():
+                self._dependencies.setdefault(name, {})[package_id] = version
+
+    def remove(self, filename: str) -> None:
+        with self._lock:
+            package_id = self._files.pop(filename, None)
+            document = self._documents.pop(package_id, None) if package_id else None
+            if document is None:
+                return
+            for term in document["terms"]:
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.discard(package_id)
+                    if not postings:
+                        del self._postings[term]
+                        self._terms_dirty = True
+            for name in document["dependencies"]:
+                versions = self._dependencies.get(name)
+                if versions is not None:
+                    versions.pop(package_id, None)
+                    if not versions:
+                        del self._dependencies[name]
+
+    # -- queries -----------------------------------------------------------
+
+    def _prefix_matches(self, prefix: str) -> Set[str]:
+        if self._terms_dirty:
+            self._sorted_terms = sorted(self._postings)
+            self._terms_dirty = False
+        matches: Set[str] = set()
+        start = bisect.bisect_left(self._sorted_terms, prefix)
+        for term in self._sorted_terms[start:]:
+            if not term.startswith(prefix):
+                break
+            matches |= self._postings[term]
+        return matches
+
+    def search(
+        self,
+        query: Optional[str] = None,
+        dependency: Optional[str] = None,
+        version: Optional[str] = None,
+        limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """Find packages matching every query term (as a prefix) and the dependency filter
+
+        ``version`` is a specifier such as '<2' or '>=1.20,<2'; a package matches
+        when its declared version range for ``dependency`` overlaps it.
+        """
+        wanted_interval = None
+        if version:
+            wanted_interval = version_interval(version)
+            if wanted_interval is None:
+                raise ValueError(f"Invalid version specifier: {version}")
+
+        with self._lock:
+            candidates: Optional[Set[str]] = None
+            for term in tokenize(query or ""):
+                matches = self._prefix_matches(term)
+                candidates = matches if candidates is None else candidates & matches
+                if not candidates:
+                    return []
+
+            dependency_versions: Dict[str, str] = {}
+            if dependency:
+                name = normalize_name(dependency)
+                for package_id, spec in self._dependencies.get(name, {}).items():
+                    if wanted_interval is not None:
+                        interval = version_interval(spec)
+                        if interval is None or not intervals_overlap(interval, wanted_interval):
+                            continue
+                    dependency_versions[package_id] = spec
+                matched = set(dependency_versions)
+                candidates = matched if candidates is None else candidates & matched
+
+            if candidates is None:
+                candidates = set(self._documents)
+
+            results = []
+            for package_id in sorted(candidates)[:limit]:
+                document = self._documents[package_id]
+                results.append({
+                    "package_id": package_id,
+                    "project_name": document["project_name"],
+                    "file_name": document["file_name"],
+                    "dependency_version": dependency_versions.get(package_id),
+                })
+            return results
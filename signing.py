@@ -0,0 +1,59 @@
+"""HMAC-signed, expiring download URLs
+
+Environment variables:
+  REPROPACK_SIGNING_KEY  Secret used to sign download URLs. If unset, a random key is
+                         generated once and stored as <packages dir>/.signing_key so
+                         every worker sharing the directory accepts the same URLs.
+"""
+
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from typing import Optional
+
+
+SIGNING_KEY_FILENAME = ".signing_key"
+
+
+def load_signing_key(packages_dir: str) -> bytes:
+    """Return the configured signing key, creating a shared one if needed"""
+    configured = os.getenv("REPROPACK_SIGNING_KEY")
+    if configured:
+        return configured.encode("utf-8")
+
+    key_path = os.path.join(packages_dir, SIGNING_KEY_FILENAME)
+    try:
+        with open(key_path, "rb") as fh:
+            return fh.read().strip()
+    except FileNotFoundError:
+        pass
+
+    # Write to a private temp file, then link it into place; if another worker
+    # won the race the link fails and we read its key instead
+    temp_path = f"{key_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as fh:
+        fh.write(secrets.token_hex(32).encode("ascii"))
+    try:
+        os.link(temp_path, key_path)
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(temp_path)
+    with open(key_path, "rb") as fh:
+        return fh.read().strip()
+
+
+def sign_download(key: bytes, package_id: str, expires: int) -> str:
+    """Sign a package ID together with its expiry timestamp"""
+    message = f"{package_id}:{expires}".encode("utf-8")
+    return hmac.new(key, message, hashlib.sha256).hexdigest()
+
+
+def verify_download(key: bytes, package_id: str, expires: int, signature: str, now: Optional[float] = None) -> bool:
+    """Check that a signature is authentic and has not expired"""
+    now = time.time() if now is None else now
+    if expires < now:
+        return False
+    return hmac.compare_digest(sign_download(key, package_id, expires), signature)
@@ -0,0 +1,99 @@
+"""Incrementally maintained package store statistics"""
+
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from indexing import BackgroundIndex
+from search import normalize_name
+
+
+HOURLY_WINDOW = 48
+
+
+def _bump(counter: Counter, key: str, delta: int) -> None:
+    """Adjust a counter, dropping keys that fall to zero"""
+    counter[key] += delta
+    if not counter[key]:
+        del counter[key]
+
+
+class PackageStats(BackgroundIndex):
+    """Running aggregates over every package in the store
+
+    Each create or removal adjusts the counters by one package, so reading
+    them never scans the store.
+    """
+
+    thread_name = "repropack-stats"
+
+    def __init__(self, refresh_seconds: Optional[float] = None):
+        super().__init__(refresh_seconds)
+        self.total_packages = 0
+        self.total_bytes = 0
+        self._project_counts: Counter = Counter()
+        self._project_bytes: Counter = Counter()
+        self._author_counts: Counter = Counter()
+        self._author_bytes: Counter = Counter()
+        self._dependency_counts: Counter = Counter()
+        self._per_day: Counter = Counter()
+        self._per_hour: Counter = Counter()
+
+    def add(self, filename: str, metadata: Dict[str, Any], file_size: int) -> None:
+        created_at = datetime.fromisoformat(metadata["created_at"])
+        contribution = {
+            "project": metadata.get("project_name") or "Unknown",
+            "author": metadata.get("author") or "Unknown",
+            "bytes": file_size,
+            "dependencies": {normalize_name(dep["name"]) for dep in metadata.get("dependencies") or []},
+            "day": created_at.strftime("%Y-%m-%d"),
+            "hour": created_at.strftime("%Y-%m-%dT%H:00"),
+        }
+        with self._lock:
+            if filename in self._files:
+                return
+            self._files[filename] = contribution
+            self._apply(contribution, 1)
+
+    def remove(self, filename: str) -> None:
+        with self._lock:
+            contribution = self._files.pop(filename, None)
+            if contribution is not None:
+                self._apply(contribution, -1)
+
+    def _apply(self, contribution: Dict[str, Any], sign: int) -> None:
+        size = contribution["bytes"] * sign
+        self.total_packages += sign
+        self.total_bytes += size
+        _bump(self._project_counts, contribution["project"], sign)
+        _bump(self._project_bytes, contribution["project"], size)
+        _bump(self._author_counts, contribution["author"], sign)
+        _bump(self._author_bytes, contribution["author"], size)
+        for name in contribution["dependencies"]:
+            _bump(self._dependency_counts, name, sign)
+        _bump(self._per_day, contribution["day"], sign)
+        _bump(self._per_hour, contribution["hour"], sign)
+
+    def snapshot(self, top_dependencies: int = 20) -> Dict[str, Any]:
+        """Return the current aggregates"""
+        now = datetime.now().replace(minute=0, second=0, microsecond=0)
+        hours = [(now - timedelta(hours=h)).strftime("%Y-%m-%dT%H:00") for h in reversed(range(HOURLY_WINDOW))]
+        with self._lock:
+            return {
+                "total_packages": self.total_packages,
+                "total_bytes": self.total_bytes,
+                "projects": {
+                    name: {"count": count, "bytes": self._project_bytes[name]}
+                    for name, count in self._project_counts.items()
+                },
+                "authors": {
+                    name: {"count": count, "bytes": self._author_bytes[name]}
+                    for name, count in self._author_counts.items()
+                },
+                "top_dependencies": [
+                    {"name": name, "count": count}
+                    for name, count in self._dependency_counts.most_common(top_dependencies)
+                ],
+                "created_per_day": dict(sorted(self._per_day.items())),
+                "created_per_hour": {hour: self._per_hour.get(hour, 0) for hour in hours},
+            }
@@ -4,20 +4,38 @@ import sys
 import zipfile
 from pathlib import Path
 
+import pytest
+
 # Ensure project root (containing main.py) is on sys.path when tests are run
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 from fastapi.testclient import TestClient  # noqa: E402
-from main import app, PACKAGES_DIR  # noqa: E402
+import main  # noqa: E402
+from main import app  # noqa: E402
 
 client = TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def packages_dir(tmp_path_factory, monkeypatch):
+    """Serve a fresh store per test so the suite never writes into the repo"""
+    store = tmp_path_factory.mktemp("packages")
+    monkeypatch.setattr(main, "PACKAGES_DIR", str(store))
+    monkeypatch.setattr(main, "get_packages_dir", lambda: str(store))
+    main.get_signing_key.cache_clear()
+    # Drop index entries left over from the previous test's store
+    for view in (main.search_index, main.package_stats):
+        view.flush()
+        view.sync(str(store))
+    yield store
+    main.get_signing_key.cache_clear()
+
+
 def cleanup_created_packages(ids):
     for pkg_id in ids:
-        for f in Path(PACKAGES_DIR).glob(f"*{pkg_id}*.zip"):
+        for f in Path(main.PACKAGES_DIR).glob(f"*{pkg_id}.zip*"):
             try:
                 f.unlink()
             except Exception:
@@ -95,3 +113,660 @@ def test_invalid_package_rejected():
     r = client.post("/create-package", json=bad_payload)
     # Either 400 from validation we add, or 500 if deeper error (treat as failure)
     assert r.status_code == 400, f"Expected 400, got {r.status_code}: {r.text}"
+
+
+def _create_package(project_name, **extra):
+    payload = {"project_name": project_name, "author": "PyTest", **extra}
+    r = client.post("/create-package", json=payload)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_bulk_download_streams_tar_and_resumes():
+    import io
+    import tarfile
+
+    created = [_create_package("BulkPkg"), _create_package("BulkPkg")]
+    created_ids = [c["package_id"] for c in created]
+    try:
+        r = client.post("/download-packages", json={"package_ids": created_ids})
+        assert r.status_code == 200, r.text
+        assert r.headers["content-type"] == "application/x-tar"
+        with tarfile.open(fileobj=io.BytesIO(r.content), mode="r:") as tf:
+            names = tf.getnames()
+            assert names == sorted(Path(c["file_path"]).name for c in created)
+            member = tf.extractfile(names[0]).read()
+            assert member == Path(main.PACKAGES_DIR, names[0]).read_bytes()
+
+        r = client.post(
+            "/download-packages",
+            json={"package_ids": created_ids, "format": "zip", "resume_after": names[0]},
+        )
+        assert r.status_code == 200, r.text
+        with zipfile.ZipFile(io.BytesIO(r.content)) as zf:
+            assert zf.namelist() == names[1:]
+
+        r = client.post("/download-packages", json={"package_ids": ["does-not-exist"]})
+        assert r.status_code == 404
+    finally:
+        cleanup_created_packages(created_ids)
+
+
+def test_publish_never_overwrites_and_cleans_up(tmp_path, monkeypatch):
+    import utils
+    from models import CreatePackageRequest
+    from utils import create_package_archive
+
+    request = CreatePackageRequest(project_name="Atomic", author="PyTest")
+    package_id = "00000000-0000-4000-8000-000000000001"
+    path, size, digest = create_package_archive(request, package_id, str(tmp_path))
+    assert Path(path).stat().st_size == size
+    assert sorted(p.name for p in tmp_path.iterdir()) == [Path(path).name, Path(path).name + ".sha256"]
+
+    # A second worker publishing the same name fails instead of replacing the archive
+    original = Path(path).read_bytes()
+    with pytest.raises(FileExistsError):
+        create_package_archive(CreatePackageRequest(project_name="Atomic", author="Other"), package_id, str(tmp_path))
+    assert Path(path).read_bytes() == original
+    assert digest in Path(path + ".sha256").read_text()
+
+    # A failure while building leaves nothing behind
+    failed_id = "00000000-0000-4000-8000-000000000003"
+
+    def failing_hash(path, throttle=None):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(utils, "sha256_file", failing_hash)
+    with pytest.raises(OSError):
+        create_package_archive(request, failed_id, str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_create_package_rate_limited(monkeypatch):
+    import main
+    from ratelimit import RateLimiter
+
+    monkeypatch.setattr(main, "rate_limiter", RateLimiter(rate_per_minute=1, burst=1))
+    created_ids = []
+    try:
+        created_ids.append(_create_package("Limited", author="Flooder")["package_id"])
+        r = client.post("/create-package", json={"project_name": "Limited", "author": "Flooder"})
+        assert r.status_code == 429
+        assert int(r.headers["retry-after"]) >= 1
+    finally:
+        cleanup_created_packages(created_ids)
+
+
+def test_author_quota_shared_through_sqlite(tmp_path):
+    from ratelimit import RateLimiter, RateLimitExceeded, SQLiteBackend
+
+    # Parent directory does not exist yet, as on a fresh store
+    db = str(tmp_path / "fresh-store" / "limits.sqlite3")
+    worker_a = RateLimiter(SQLiteBackend(db), max_packages=5, max_bytes=1000, window_seconds=60)
+    worker_b = RateLimiter(SQLiteBackend(db), max_packages=5, max_bytes=1000, window_seconds=60)
+
+    worker_a.check("10.0.0.1", "alice", now=120)
+    worker_a.record("alice", 1000, now=120)
+    with pytest.raises(RateLimitExceeded) as exc:
+        worker_b.check("10.0.0.2", "alice", now=130)
+    assert exc.value.retry_after == 50
+    # Quota resets with the next window; other authors are unaffected
+    worker_b.check("10.0.0.2", "alice", now=185)
+    worker_b.check("10.0.0.2", "bob", now=130)
+
+
+def test_limits_shared_across_workers_by_default(tmp_path, monkeypatch):
+    from ratelimit import MemoryBackend, RateLimiter, SQLiteBackend
+
+    assert isinstance(RateLimiter.from_env(str(tmp_path)).backend, MemoryBackend)
+    monkeypatch.setenv("REPROPACK_QUOTA_MAX_PACKAGES", "5")
+    assert isinstance(RateLimiter.from_env(str(tmp_path)).backend, SQLiteBackend)
+    monkeypatch.setenv("REPROPACK_RATE_LIMIT_BACKEND", "memory")
+    assert isinstance(RateLimiter.from_env(str(tmp_path)).backend, MemoryBackend)
+
+
+def test_quota_reserved_atomically_and_buckets_evicted():
+    from concurrent.futures import ThreadPoolExecutor
+    from ratelimit import RateLimiter, RateLimitExceeded
+
+    limiter = RateLimiter(max_packages=3, window_seconds=60)
+
+    def attempt(_):
+        try:
+            limiter.check("10.0.0.1", "alice", now=10)
+            return True
+        except RateLimitExceeded:
+            return False
+
+    # Creates in flight at once cannot overshoot the quota
+    with ThreadPoolExecutor(8) as pool:
+        assert sum(pool.map(attempt, range(20))) == 3
+    # A failed creation gives its slot back
+    limiter.release("alice", now=10)
+    assert attempt(None)
+
+    # A request refused for its author keeps the client's token
+    limiter = RateLimiter(rate_per_minute=1, burst=1)
+    limiter.check("c1", "alice", now=0)
+    with pytest.raises(RateLimitExceeded, match="author:alice"):
+        limiter.check("c2", "alice", now=0)
+    limiter.check("c2", "bob", now=0)
+
+    limiter = RateLimiter(rate_per_minute=60, burst=2)
+    for i in range(100):
+        limiter.check(f"10.0.0.{i}", f"author-{i}", now=0)
+    assert len(limiter.backend._buckets) == 200
+    # Buckets that have refilled to capacity are dropped
+    limiter.check("10.0.0.1", "alice", now=10)
+    assert len(limiter.backend._buckets) == 2
+
+
+def test_oversized_bodies_rejected_before_parsing():
+    from middleware import DEFAULT_MAX_BODY_BYTES
+
+    big_description = "x" * (DEFAULT_MAX_BODY_BYTES + 1)
+    r = client.post("/create-package", json={"project_name": "Big", "author": "PyTest", "description": big_description})
+    assert r.status_code == 413
+
+    def chunked_body():
+        yield b'{"project_name": "Big", "author": "PyTest", "setup_scripts": ['
+        for _ in range(DEFAULT_MAX_BODY_BYTES // 1024 + 1):
+            yield b'"' + b"y" * 1024 + b'",'
+        yield b'"done"]}'
+
+    r = client.post("/create-package", content=chunked_body(), headers={"content-type": "application/json"})
+    assert r.status_code == 413
+
+
+def test_field_limits_enforced():
+    from models import MAX_DEPENDENCIES
+
+    payload = {
+        "project_name": "TooMany",
+        "author": "PyTest",
+        "dependencies": [{"name": f"pkg{i}", "version": "1.0"} for i in range(MAX_DEPENDENCIES + 1)],
+    }
+    r = client.post("/create-package", json=payload)
+    assert r.status_code == 422
+
+
+def test_signed_download_urls(monkeypatch):
+    import main
+
+    created = _create_package("SignedPkg")
+    pkg_id = created["package_id"]
+    try:
+        r = client.get(f"/download-url/{pkg_id}", params={"expires_in": 60})
+        assert r.status_code == 200, r.text
+        url = r.json()["url"]
+
+        r = client.get(url)
+        assert r.status_code == 200
+        assert r.content == Path(created["file_path"]).read_bytes()
+
+        r = client.get(url.replace("signature=", "signature=0"))
+        assert r.status_code == 403
+        expired = client.get(f"/signed-download/{pkg_id}", params={"expires": 1, "signature": "x"})
+        assert expired.status_code == 403
+
+        # With offloading enabled Python only emits the redirect header
+        monkeypatch.setattr(main, "SENDFILE_MODE", "x-accel-redirect")
+        r = client.get(url)
+        assert r.status_code == 200
+        assert r.content == b""
+        assert r.headers["x-accel-redirect"] == "/protected-packages/" + Path(created["file_path"]).name
+    finally:
+        cleanup_created_packages([pkg_id])
+
+
+def test_search_by_text_and_dependency_range():
+    import main
+
+    old_numpy = _create_package(
+        "Search Legacy",
+        description="Uses the census dataset",
+        dependencies=[{"name": "numpy", "version": "1.24.0"}],
+        dataset_links=["https://example.org/census.csv"],
+    )
+    new_numpy = _create_package(
+        "Search Modern",
+        dependencies=[{"name": "NumPy", "version": ">=2.0"}],
+        environment_variables={"MODEL_PATH": "/models"},
+    )
+    created_ids = [old_numpy["package_id"], new_numpy["package_id"]]
+    try:
+        main.search_index.flush()
+
+        r = client.get("/search", params={"dependency": "numpy", "version": "<2"})
+        assert r.status_code == 200, r.text
+        ids = {res["package_id"] for res in r.json()["results"]}
+        assert old_numpy["package_id"] in ids
+        assert new_numpy["package_id"] not in ids
+
+        r = client.get("/search", params={"q": "censu"})
+        assert old_numpy["package_id"] in {res["package_id"] for res in r.json()["results"]}
+
+        r = client.get("/search", params={"q": "search model_path"})
+        assert [res["package_id"] for res in r.json()["results"]] == [new_numpy["package_id"]]
+
+        r = client.get("/search", params={"version": "<2"})
+        assert r.status_code == 400
+    finally:
+        cleanup_created_packages(created_ids)
+
+
+def test_search_version_ranges_respect_precision():
+    from search import intervals_overlap, version_interval
+
+    def overlaps(spec, wanted):
+        return intervals_overlap(version_interval(spec), version_interval(wanted))
+
+    # Compatible release: the ceiling bumps the second-to-last segment as written
+    assert version_interval("~=2.0.0") == (((2,), True), ((2, 1), False))
+    assert version_interval("~=1.4.0") == (((1, 4), True), ((1, 5), False))
+    assert version_interval("~=1.4") == (((1, 4), True), ((2,), False))
+    assert not overlaps("~=2.0.0", ">=2.5")
+    assert overlaps("~=2.0.0", ">=2.0.5")
+    # Wildcards cover the whole prefix, not a single version
+    assert version_interval("==2.0.*") == (((2,), True), ((2, 1), False))
+    assert overlaps("==2.0.*", "==2.0.7")
+    assert not overlaps("==2.0.*", ">=2.1")
+    assert overlaps("==2.*", "<2.9,>2.5")
+
+
+def test_import_time_budget(tmp_path):
+    """Record `python -X importtime` for main:app and guard the cold-start cost we control"""
+    import subprocess
+
+    # Packages main imports on purpose; everything else under main counts against the budget
+    framework_packages = {"fastapi", "starlette", "pydantic", "pydantic_core", "anyio", "typing_extensions"}
+    deferred_modules = ["tarfile", "sqlite3"]
+    packages_dir = tmp_path / "packages"
+    env = {**os.environ, "REPROPACK_PACKAGES_DIR": str(packages_dir)}
+    probe = (
+        "import sys; import main; "
+        f"print([m for m in {deferred_modules!r} if m in sys.modules])"
+    )
+    def own_import_us():
+        """Cumulative time of main minus the framework subtrees, from one cold interpreter"""
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", probe],
+            cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True
+        )
+        # importtime prints the import tree in post-order: children (indented
+        # one level deeper) come before their parent
+        pending = {}
+        main_us = framework_us = 0
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if not cumulative.strip().isdigit():
+                continue
+            depth = (len(name) - len(name.lstrip())) // 2
+            name = name.strip()
+            children = pending.pop(depth + 1, [])
+            pending.setdefault(depth, []).append((name, int(cumulative), children))
+            if name == "main":
+                main_us = int(cumulative)
+                stack = list(children)
+                while stack:
+                    child, child_us, grandchildren = stack.pop()
+                    if child.split(".")[0] in framework_packages:
+                        framework_us += child_us
+                    else:
+                        stack.extend(grandchildren)
+        assert main_us, "main not found in importtime output"
+        return main_us - framework_us, result
+
+    # Best of a few runs, so a busy machine does not fail the budget
+    own_us, result = min((own_import_us() for _ in range(3)), key=lambda run: run[0])
+    budget_ms = float(os.getenv("REPROPACK_IMPORT_BUDGET_MS", "150"))
+    own_ms = own_us / 1000
+    assert own_ms <= budget_ms, (
+        f"Importing main took {own_ms:.1f}ms outside the web framework (budget {budget_ms}ms)"
+    )
+    assert result.stdout.strip() == "[]", f"Deferred modules imported eagerly: {result.stdout}"
+    assert not packages_dir.exists(), "Importing main must not touch the filesystem"
+
+
+def test_diff_packages():
+    before = _create_package(
+        "DiffPkg",
+        dependencies=[{"name": "numpy", "version": "1.24.0"}, {"name": "pandas", "version": "2.0.0"}],
+        environment_variables={"DEBUG": "true", "DATA_PATH": "/data"},
+        setup_scripts=["make data"],
+    )
+    after = _create_package(
+        "DiffPkg",
+        dependencies=[{"name": "numpy", "version": "2.0.0"}, {"name": "scipy", "version": "1.11.0"}],
+        environment_variables={"DEBUG": "false", "MODEL_PATH": "/models", "DATA_PATH": "/data"},
+        setup_scripts=["make data", "make models"],
+    )
+    created_ids = [before["package_id"], after["package_id"]]
+    try:
+        r = client.get(f"/diff/{before['package_id']}/{after['package_id']}")
+        assert r.status_code == 200, r.text
+        diff = r.json()
+        assert diff["identical"] is False
+        assert diff["dependencies"] == [
+            {"name": "numpy", "old_version": "1.24.0", "new_version": "2.0.0"},
+            {"name": "pandas", "old_version": "2.0.0", "new_version": None},
+            {"name": "scipy", "old_version": None, "new_version": "1.11.0"},
+        ]
+        assert [c["key"] for c in diff["environment_variables"]] == ["DEBUG", "MODEL_PATH"]
+        assert diff["setup_scripts"]["added"] == ["make models"]
+
+        r = client.get(f"/diff/{before['package_id']}/{before['package_id']}")
+        assert r.json()["identical"] is True
+
+        r = client.get(f"/diff/{before['package_id']}/missing")
+        assert r.status_code == 404
+    finally:
+        cleanup_created_packages(created_ids)
+
+
+def test_verify_detects_corruption(tmp_path):
+    from integrity import ArchiveScrubber
+
+    created = _create_package("VerifyPkg", dependencies=[{"name": "requests", "version": "2.31.0"}])
+    pkg_id = created["package_id"]
+    try:
+        assert created["sha256"]
+        r = client.get(f"/verify/{pkg_id}")
+        assert r.status_code == 200, r.text
+        result = r.json()
+        assert result["ok"] is True
+        assert result["recorded_sha256"] == created["sha256"]
+        assert {m["name"] for m in result["members"]} >= {"metadata.json", "requirements.txt"}
+
+        # Flip one byte and let the scrubber find it
+        store = tmp_path / "store"
+        store.mkdir()
+        for f in Path(main.PACKAGES_DIR).glob(f"*{pkg_id}.zip*"):
+            (store / f.name).write_bytes(f.read_bytes())
+        corrupt = store / Path(created["file_path"]).name
+        data = bytearray(corrupt.read_bytes())
+        data[-30] ^= 0xFF
+        corrupt.write_bytes(bytes(data))
+
+        scrubber = ArchiveScrubber(str(store), interval_seconds=1, bytes_per_second=0)
+        assert scrubber.scrub_once() == 1
+        assert "Archive digest mismatch" in scrubber.failures[corrupt.name]["errors"]
+        # Another worker's scrubber reports the same failures from the shared store
+        assert set(ArchiveScrubber(str(store), interval_seconds=1).failures) == {corrupt.name}
+        corrupt.unlink()
+        assert scrubber.failures == {}
+    finally:
+        cleanup_created_packages([pkg_id])
+
+
+def test_reindex_backfills_and_resumes(tmp_path, monkeypatch):
+    import json
+    from models import CreatePackageRequest
+    from reindex import reindex
+    from utils import create_package_archive
+
+    store = tmp_path / "store"
+    store.mkdir()
+    paths = [
+        create_package_archive(CreatePackageRequest(project_name=f"Old{i}", author="PyTest"), f"id-{i}", str(store))[0]
+        for i in range(3)
+    ]
+    # Simulate an archive written before digests were recorded
+    Path(paths[0] + ".sha256").unlink()
+    # A foreign archive without package_id, a file that is not a zip, and an
+    # archive whose metadata.json member has bit-rotted
+    with zipfile.ZipFile(store / "Foreign_0000.zip", "w") as zf:
+        zf.writestr("metadata.json", json.dumps({"project_name": "Foreign"}))
+    (store / "Broken_0001.zip").write_bytes(b"not a zip")
+    rotten = store / "Rotten_0002.zip"
+    with zipfile.ZipFile(rotten, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("metadata.json", json.dumps({"package_id": "rotten", "description": "x" * 4096}))
+    with zipfile.ZipFile(rotten) as zf:
+        info = zf.getinfo("metadata.json")
+    data = bytearray(rotten.read_bytes())
+    start = info.header_offset + 30 + len(info.filename) + 4
+    data[start:start + 8] = bytes(b ^ 0xFF for b in data[start:start + 8])
+    rotten.write_bytes(bytes(data))
+
+    summary = reindex(str(store), workers=2, out=None)
+    assert summary["processed"] == 6 and summary["errors"] == 3
+    assert Path(paths[0] + ".sha256").exists()
+    records = [json.loads(line) for line in (store / ".index.jsonl").read_text().splitlines()]
+    # The run finished and compacted: failed archives are retried next run, not recorded
+    assert sorted(r["package_id"] for r in records) == ["id-0", "id-1", "id-2"]
+    for name in ("Foreign_0000.zip", "Broken_0001.zip", "Rotten_0002.zip"):
+        (store / name).unlink()
+
+    create_package_archive(CreatePackageRequest(project_name="New", author="PyTest"), "id-3", str(store))
+    # An earlier failed attempt on id-3 and a record for a deleted archive
+    with open(store / ".index.jsonl", "a") as fh:
+        fh.write(json.dumps({"file_name": Path(paths[2]).name.replace("id-2", "id-3").replace("Old2", "New"),
+                             "error": "busy"}) + "\n")
+    Path(paths[1]).unlink()
+    summary = reindex(str(store), workers=2, out=None)
+    assert summary["processed"] == 1 and summary["skipped"] == 2
+    records = [json.loads(line) for line in (store / ".index.jsonl").read_text().splitlines()]
+    assert sorted(r["package_id"] for r in records) == ["id-0", "id-2", "id-3"]
+
+    # The server's views load from the index without opening the archives
+    import indexing
+    from search import SearchIndex
+
+    def unreadable(path):
+        raise AssertionError(f"archive opened: {path}")
+
+    monkeypatch.setattr(indexing, "load_package_metadata", unreadable)
+    index = SearchIndex()
+    index.sync(str(store))
+    assert len(index.search(query="old")) == 2
+
+
+def test_stats_maintained_incrementally():
+    import main
+
+    r = client.get("/stats")
+    assert r.status_code == 200, r.text
+    before = r.json()
+
+    created = [
+        _create_package("StatsPkg", author="StatsAuthor", dependencies=[{"name": "Flask", "version": "3.0.0"}]),
+        _create_package("StatsPkg", author="StatsAuthor", dependencies=[{"name": "flask", "version": "2.0.0"}]),
+    ]
+    created_ids = [c["package_id"] for c in created]
+    try:
+        main.package_stats.flush()
+        after = client.get("/stats", params={"top": 1000}).json()
+        assert after["total_packages"] == before["total_packages"] + 2
+        assert after["projects"]["StatsPkg"] == {
+            "count": 2,
+            "bytes": sum(c["file_size"] for c in created),
+        }
+        assert after["authors"]["StatsAuthor"]["count"] == 2
+        assert {"name": "flask", "count": 2} in after["top_dependencies"]
+        assert sum(after["created_per_hour"].values()) >= 2
+    finally:
+        cleanup_created_packages(created_ids)
+
+    # Removed archives are subtracted on the next rescan
+    main.package_stats.sync(main.PACKAGES_DIR)
+    assert "StatsPkg" not in main.package_stats.snapshot()["projects"]
+
+
+def test_slow_disk_does_not_block_other_requests(monkeypatch):
+    import asyncio
+    import time
+
+    import httpx
+    import main
+    from aio import IO_CONCURRENCY
+
+    # More archives than the shared limiter has slots
+    created = [_create_package(f"SlowDiskPkg{i}") for i in range(IO_CONCURRENCY + 4)]
+
+    def slow_metadata(package_path):
+        time.sleep(0.5)
+        return None
+
+    monkeypatch.setattr(main, "load_package_metadata", slow_metadata)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            listing = asyncio.create_task(ac.get("/list-packages"))
+            await asyncio.sleep(0.05)
+            started = time.perf_counter()
+            health = await ac.get("/health")
+            health_seconds = time.perf_counter() - started
+            assert not listing.done()
+            return health, health_seconds, await listing
+
+    try:
+        health, health_seconds, listing = asyncio.run(scenario())
+        assert health.status_code == 200
+        assert health_seconds < 0.3
+        assert listing.status_code == 200
+    finally:
+        cleanup_created_packages([c["package_id"] for c in created])
+
+
+def test_load_harness_generates_store_and_drives_traffic(tmp_path, monkeypatch):
+    import asyncio
+
+    import httpx
+    import main
+    from loadtest import generate_store, run_load
+
+    result = generate_store(str(tmp_path), count=20, workers=1, seed=1)
+    assert result["packages"] == 20
+    assert len(list(tmp_path.glob("*.zip"))) == 20
+
+    # Serve the generated store
+    monkeypatch.setattr(main, "PACKAGES_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "get_packages_dir", lambda: str(tmp_path))
+
+    summary = asyncio.run(run_load(
+        "http://test", rps=40, duration=0.5, mix={"create": 1, "list": 1, "download": 2},
+        transport=httpx.ASGITransport(app=main.app), out=None
+    ))
+    assert summary["requests"] > 0
+    assert summary["errors"] == 0
+    assert summary["operations"]["create"]["requests"] > 0
+    assert len(list(tmp_path.glob("*.zip"))) == 20 + summary["operations"]["create"]["requests"]
+    assert summary["operations"]["list"]["p99_ms"] >= summary["operations"]["list"]["p50_ms"]
+
+
+def test_output_formats_share_cached_dependency_fragments():
+    import io
+    import json
+    import utils
+
+    dependencies = [{"name": "numpy", "version": "1.26.0"}, {"name": "pandas", "version": "2.1.0"}]
+    formats = ["dockerfile", "conda", "devcontainer"]
+    first = _create_package("FormatsPkg", dependencies=dependencies, setup_scripts=["echo hi"], output_formats=formats)
+    hits_before = utils._render_dependency_fragment.cache_info().hits
+    # Same dependency set in a different order renders from the cache
+    second = _create_package("FormatsPkg2", dependencies=dependencies[::-1], output_formats=formats)
+    created_ids = [first["package_id"], second["package_id"]]
+    try:
+        assert utils._render_dependency_fragment.cache_info().hits >= hits_before + 2
+
+        r = client.get(f"/download-package/{first['package_id']}")
+        with zipfile.ZipFile(io.BytesIO(r.content)) as zf:
+            names = set(zf.namelist())
+            dockerfile = zf.read("Dockerfile").decode()
+            environment = zf.read("environment.yml").decode()
+            devcontainer = json.loads(zf.read(".devcontainer/devcontainer.json"))
+            manifest = json.loads(zf.read("manifest.json"))
+        assert {"Dockerfile", "environment.yml", ".devcontainer/devcontainer.json"} <= names
+        # Requirements are installed once, in the cached layer, before the scripts run
+        assert dockerfile.count("pip install") == 1
+        assert dockerfile.index("pip install -r requirements.txt") < dockerfile.index("echo hi")
+        assert '"numpy==1.26.0"' in environment
+        assert devcontainer["build"]["dockerfile"] == "../Dockerfile"
+        assert "Dockerfile" in json.dumps(manifest)
+
+        r = client.get(f"/download-package/{second['package_id']}")
+        with zipfile.ZipFile(io.BytesIO(r.content)) as zf:
+            second_dockerfile = zf.read("Dockerfile").decode()
+        install_step = dockerfile[dockerfile.index("LABEL"):dockerfile.index("COPY . .")].split("\n\n")[0]
+        assert install_step in second_dockerfile
+
+        # Differing only in outputs is still a difference
+        third = _create_package("FormatsPkg2", dependencies=dependencies, output_formats=["devcontainer"])
+        created_ids.append(third["package_id"])
+        diff = client.get(f"/diff/{second['package_id']}/{third['package_id']}").json()
+        assert diff["identical"] is False
+        assert diff["output_formats"]["removed"] == ["dockerfile", "conda"]
+
+        r = client.get(f"/download-package/{third['package_id']}")
+        with zipfile.ZipFile(io.BytesIO(r.content)) as zf:
+            devcontainer = json.loads(zf.read(".devcontainer/devcontainer.json"))
+        # setup.sh installs requirements.txt itself
+        assert devcontainer["postCreateCommand"] == "bash setup.sh"
+    finally:
+        cleanup_created_packages(created_ids)
+
+
+def test_malformed_archive_does_not_stop_rescan(tmp_path):
+    import json
+    import uuid
+    from models import CreatePackageRequest
+    from search import SearchIndex
+    from stats import PackageStats
+    from utils import create_package_archive
+
+    package_ids = [str(uuid.uuid4()) for _ in range(12)]
+    for i, package_id in enumerate(package_ids):
+        request = CreatePackageRequest(
+            project_name=f"Scan{i}", author="PyTest", dependencies=[{"name": "scanlib", "version": "1.0"}]
+        )
+        create_package_archive(request, package_id, str(tmp_path))
+    # A foreign archive without package_id/created_at, and a file that is not a zip at all
+    with zipfile.ZipFile(tmp_path / "Foreign_0000.zip", "w") as zf:
+        zf.writestr("metadata.json", json.dumps({"project_name": "Foreign"}))
+    (tmp_path / "Broken_0001.zip").write_bytes(b"not a zip")
+
+    index, stats = SearchIndex(), PackageStats()
+    for view in (index, stats):
+        view.sync(str(tmp_path))
+        view.sync(str(tmp_path))
+
+    assert stats.snapshot()["total_packages"] == len(package_ids)
+    found = {res["package_id"] for res in index.search(dependency="scanlib")}
+    assert found == set(package_ids)
+
+
+def test_load_harness_measures_worker_scaling(tmp_path):
+    import socket
+    from loadtest import generate_store, measure_scaling
+
+    generate_store(str(tmp_path), count=5, workers=1, seed=2)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    report = measure_scaling(
+        [1, 2], str(tmp_path), rps=20, duration=0.5, mix={"list": 1, "download": 1}, port=port, out=None
+    )
+    assert [r["workers"] for r in report["results"]] == [1, 2]
+    assert all(r["requests"] > 0 and r["error_rate"] == 0 for r in report["results"])
+    assert report["results"][0]["speedup"] == 1.0
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="needs Linux /proc")
+def test_server_rss_includes_worker_processes():
+    import subprocess
+    import time
+    from loadtest import _process_rss_bytes, read_rss_bytes
+
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        deadline = time.monotonic() + 5
+        while not _process_rss_bytes(child.pid) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert read_rss_bytes(os.getpid()) >= _process_rss_bytes(os.getpid()) + _process_rss_bytes(child.pid) // 2
+    finally:
+        child.kill()
+        child.wait()
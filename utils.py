@@ -1,13 +1,14 @@
 import os
 import json
+import hashlib
 import zipfile
-import tarfile
 import uuid
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, Any, Optional
-from pathlib import Path
 
 from models import CreatePackageRequest, DependencyModel
+from integrity import DIGEST_SUFFIX, MANIFEST_NAME, build_manifest, sha256_file, write_digest_file
 
 
 def generate_package_id() -> str:
@@ -39,8 +40,16 @@ def create_environment_file(env_vars: Dict[str, str]) -> str:
     return "\n".join(lines)
 
 
-def create_setup_script(setup_scripts: list[str], dependencies: list[DependencyModel]) -> str:
-    """Create setup.sh/setup.bat script content"""
+def create_setup_script(
+    setup_scripts: list[str],
+    dependencies: list[DependencyModel],
+    install_dependencies: bool = True
+) -> str:
+    """Create setup.sh/setup.bat script content
+
+    ``install_dependencies=False`` leaves out the pip install, for callers
+    that install requirements.txt themselves (the generated Dockerfile).
+    """
     lines = [
         "#!/bin/bash",
         "# Generated by ReproPack - Setup Script",
@@ -51,7 +60,7 @@ def create_setup_script(setup_scripts: list[str], dependencies: list[DependencyM
     ]
     
     # Add Python environment setup
-    if dependencies:
+    if dependencies and install_dependencies:
         lines.extend([
             "# Install Python dependencies",
             "echo 'Installing Python dependencies...'",
@@ -199,9 +208,122 @@ def create_readme(request: CreatePackageRequest) -> str:
     return "\n".join(lines)
 
 
-def create_metadata_json(request: CreatePackageRequest, package_id: str) -> str:
-    """Create metadata.json content"""
-    metadata = {
+PYTHON_VERSION = "3.11"
+DOCKERFILE_HEREDOC = "REPROPACK_SETUP_EOF"
+FRAGMENT_CACHE_SIZE = int(os.getenv("REPROPACK_FRAGMENT_CACHE_SIZE", "1024"))
+
+
+def dependency_set_hash(dependencies: list[DependencyModel]) -> str:
+    """Order-independent SHA-256 of a dependency set"""
+    lines = sorted({dep.to_pip_format() for dep in dependencies})
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def _render_dependency_fragment(output_format: str, dependency_hash: str, pip_lines: tuple) -> str:
+    """Render the dependency-dependent part of an output format
+
+    Cached per dependency-set hash: packages sharing a dependency set share
+    the rendered fragment, and therefore the downstream Docker/conda cache.
+    """
+    if output_format == "dockerfile":
+        lines = [
+            f'LABEL org.repropack.dependency-set="{dependency_hash}"',
+            "# Dependencies first: this layer is reused until requirements.txt changes",
+            "COPY requirements.txt ./",
+        ]
+        if pip_lines:
+            lines.append("RUN --mount=type=cache,target=/root/.cache/pip pip install -r requirements.txt")
+        return "\n".join(lines)
+    if output_format == "conda":
+        lines = ["  - pip"]
+        if pip_lines:
+            lines.append("  - pip:")
+            lines.extend(f"    - {json.dumps(line)}" for line in pip_lines)
+        return "\n".join(lines)
+    raise ValueError(f"Unsupported output format: {output_format}")
+
+
+def _dependency_fragment(output_format: str, dependencies: list[DependencyModel]) -> str:
+    pip_lines = tuple(sorted({dep.to_pip_format() for dep in dependencies}))
+    return _render_dependency_fragment(output_format, dependency_set_hash(dependencies), pip_lines)
+
+
+def create_dockerfile(request: CreatePackageRequest) -> str:
+    """Create a Dockerfile ordered for layer caching (dependencies before scripts)"""
+    lines = [
+        "# syntax=docker/dockerfile:1",
+        "# Generated by ReproPack",
+        f"FROM python:{PYTHON_VERSION}-slim",
+        "WORKDIR /app",
+        "",
+        _dependency_fragment("dockerfile", request.dependencies),
+        "",
+    ]
+    
+    if request.setup_scripts:
+        # Inline the scripts without setup.sh's pip install, which the cached
+        # layer above already did
+        script = create_setup_script(request.setup_scripts, request.dependencies, install_dependencies=False)
+        lines.extend([
+            "# Setup scripts change more often than dependencies, so they come last",
+            f"RUN bash <<'{DOCKERFILE_HEREDOC}'",
+            script,
+            DOCKERFILE_HEREDOC,
+            "",
+        ])
+    
+    lines.extend([
+        "COPY . .",
+        "# Copy .env.example to .env and fill in values at runtime; secrets are not baked in",
+        'CMD ["bash"]'
+    ])
+    
+    return "\n".join(lines)
+
+
+def create_conda_environment(request: CreatePackageRequest) -> str:
+    """Create conda environment.yml content"""
+    safe_name = "".join(c for c in request.project_name if c.isalnum() or c in ('-', '_')) or "repropack-env"
+    lines = [
+        "# Generated by ReproPack",
+        f"name: {safe_name}",
+        "channels:",
+        "  - conda-forge",
+        "dependencies:",
+        f"  - python={PYTHON_VERSION}",
+        _dependency_fragment("conda", request.dependencies),
+    ]
+    
+    return "\n".join(lines) + "\n"
+
+
+def create_devcontainer_config(request: CreatePackageRequest) -> str:
+    """Create .devcontainer/devcontainer.json content"""
+    config: Dict[str, Any] = {"name": request.project_name}
+    if "dockerfile" in request.output_formats:
+        # Reuse the cached layers of the generated Dockerfile
+        config["build"] = {"dockerfile": "../Dockerfile", "context": ".."}
+    else:
+        config["image"] = f"mcr.microsoft.com/devcontainers/python:{PYTHON_VERSION}"
+        # setup.sh already installs requirements.txt before running the scripts
+        if request.dependencies or request.setup_scripts:
+            config["postCreateCommand"] = "bash setup.sh"
+    config["customizations"] = {"vscode": {"extensions": ["ms-python.python"]}}
+    
+    return json.dumps(config, indent=2)
+
+
+OUTPUT_RENDERERS = {
+    "dockerfile": ("Dockerfile", create_dockerfile),
+    "conda": ("environment.yml", create_conda_environment),
+    "devcontainer": (".devcontainer/devcontainer.json", create_devcontainer_config),
+}
+
+
+def build_package_metadata(request: CreatePackageRequest, package_id: str) -> Dict[str, Any]:
+    """Build the metadata dictionary stored in metadata.json"""
+    return {
         "package_id": package_id,
         "project_name": request.project_name,
         "author": request.author,
@@ -219,47 +341,86 @@ def create_metadata_json(request: CreatePackageRequest, package_id: str) -> str:
         "setup_scripts": request.setup_scripts,
         "dataset_links": request.dataset_links,
         "instructions": request.instructions,
+        "output_formats": request.output_formats,
         "repropack_version": "1.0.0"
     }
-    
-    return json.dumps(metadata, indent=2)
 
 
-def create_package_archive(request: CreatePackageRequest, package_id: str, packages_dir: str) -> tuple[str, int]:
-    """Create a compressed package archive with all necessary files"""
+def create_metadata_json(request: CreatePackageRequest, package_id: str) -> str:
+    """Create metadata.json content"""
+    return json.dumps(build_package_metadata(request, package_id), indent=2)
+
+
+def create_package_archive(
+    request: CreatePackageRequest,
+    package_id: str,
+    packages_dir: str,
+    indexes=()
+) -> tuple[str, int, str]:
+    """Create a compressed package archive with all necessary files
+
+    Returns the archive path, its size and its SHA-256 digest.
+
+    The new package is submitted to each of ``indexes`` (see
+    ``indexing.BackgroundIndex``) once published; they apply it in the
+    background.
+    """
     
     # Create package filename
     safe_project_name = "".join(c for c in request.project_name if c.isalnum() or c in ('-', '_')).strip()
     package_filename = f"{safe_project_name}_{package_id}.zip"
     package_path = os.path.join(packages_dir, package_filename)
+    # Build under a hidden temporary name so other workers listing the
+    # directory never see a partially written archive
+    temp_path = os.path.join(packages_dir, f".{package_filename}.{os.getpid()}.tmp")
     
-    # Create the zip file
-    with zipfile.ZipFile(package_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        
-        # Add README.md
-        readme_content = create_readme(request)
-        zipf.writestr("README.md", readme_content)
-        
-        # Add requirements.txt
-        requirements_content = create_requirements_txt(request.dependencies)
-        zipf.writestr("requirements.txt", requirements_content)
-        
-        # Add .env.example
-        env_content = create_environment_file(request.environment_variables)
-        zipf.writestr(".env.example", env_content)
-        
-        # Add setup script
-        setup_content = create_setup_script(request.setup_scripts, request.dependencies)
-        zipf.writestr("setup.sh", setup_content)
-        
-        # Add metadata.json
-        metadata_content = create_metadata_json(request, package_id)
-        zipf.writestr("metadata.json", metadata_content)
+    # Render package members
+    metadata = build_package_metadata(request, package_id)
+    members = {
+        "README.md": create_readme(request),
+        "requirements.txt": create_requirements_txt(request.dependencies),
+        ".env.example": create_environment_file(request.environment_variables),
+        "setup.sh": create_setup_script(request.setup_scripts, request.dependencies),
+        "metadata.json": json.dumps(metadata, indent=2),
+    }
+    for output_format in dict.fromkeys(request.output_formats):
+        member_name, render = OUTPUT_RENDERERS[output_format]
+        members[member_name] = render(request)
+    members = {name: content.encode("utf-8") for name, content in members.items()}
     
-    # Get file size
-    file_size = os.path.getsize(package_path)
+    published = []
+    try:
+        # Create the zip file, with a manifest of per-member SHA-256 hashes
+        with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for name, content in members.items():
+                zipf.writestr(name, content)
+            zipf.writestr(MANIFEST_NAME, build_manifest(members))
+        
+        # Record the whole-archive digest before the archive becomes visible,
+        # then publish both with hard links, which (unlike a rename) fail
+        # rather than overwrite if another worker already published the name
+        file_size = os.path.getsize(temp_path)
+        digest = sha256_file(temp_path)
+        write_digest_file(temp_path, digest, package_filename)
+        os.link(temp_path + DIGEST_SUFFIX, package_path + DIGEST_SUFFIX)
+        published.append(package_path + DIGEST_SUFFIX)
+        os.link(temp_path, package_path)
+    except BaseException:
+        # Leave nothing behind for a package that was never published
+        for leftover in published:
+            os.remove(leftover)
+        raise
+    finally:
+        for leftover in (temp_path, temp_path + DIGEST_SUFFIX):
+            try:
+                os.remove(leftover)
+            except OSError:
+                pass
+
+    for index in indexes:
+        index.submit(package_filename, metadata, file_size)
     
-    return package_path, file_size
+    return package_path, file_size, digest
 
 
 def get_package_metadata_from_file(package_path: str) -> Optional[Dict[str, Any]]:
@@ -274,6 +435,26 @@ def get_package_metadata_from_file(package_path: str) -> Optional[Dict[str, Any]
     return None
 
 
+METADATA_CACHE_SIZE = int(os.getenv("REPROPACK_METADATA_CACHE_SIZE", "4096"))
+
+
+@lru_cache(maxsize=METADATA_CACHE_SIZE)
+def _cached_package_metadata(package_path: str, mtime_ns: int, size: int) -> Optional[Dict[str, Any]]:
+    return get_package_metadata_from_file(package_path)
+
+
+def load_package_metadata(package_path: str) -> Optional[Dict[str, Any]]:
+    """Extract metadata from a package file, cached while the file is unchanged
+
+    The returned dictionary is shared between callers and must not be mutated.
+    """
+    try:
+        stats = os.stat(package_path)
+    except FileNotFoundError:
+        return None
+    return _cached_package_metadata(package_path, stats.st_mtime_ns, stats.st_size)
+
+
 def validate_pip_dependencies(dependencies: list[DependencyModel]) -> list[str]:
     """Validate that dependencies follow pip freeze style format"""
     errors = []
@@ -292,3 +473,181 @@ def validate_pip_dependencies(dependencies: list[DependencyModel]) -> list[str]:
                 errors.append(f"Invalid version format for {dep.name}: {dep.version}")
     
     return errors
+
+
+BULK_CHUNK_SIZE = 64 * 1024
+
+
+class _ChunkBuffer:
+    """Write-only sink that collects bytes until the generator drains them"""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _iter_file_chunks(path: str):
+    with open(path, "rb") as fh:
+        while True:
+            chunk = fh.read(BULK_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _iter_tar_stream(paths: list[str]):
+    # Only bulk downloads need tarfile; keep it out of the import path
+    import tarfile
+
+    for path in paths:
+        stat = os.stat(path)
+        info = tarfile.TarInfo(name=os.path.basename(path))
+        info.size = stat.st_size
+        info.mtime = int(stat.st_mtime)
+        info.mode = 0o644
+        yield info.tobuf(format=tarfile.PAX_FORMAT)
+
+        written = 0
+        for chunk in _iter_file_chunks(path):
+            written += len(chunk)
+            yield chunk
+        if written != info.size:
+            raise OSError(f"Package changed while streaming: {path}")
+
+        remainder = info.size % tarfile.BLOCKSIZE
+        if remainder:
+            yield tarfile.NUL * (tarfile.BLOCKSIZE - remainder)
+
+    # End-of-archive marker: two empty blocks
+    yield tarfile.NUL * (tarfile.BLOCKSIZE * 2)
+
+
+def _iter_zip_stream(paths: list[str]):
+    buffer = _ChunkBuffer()
+    # Members are already-compressed ZIPs, so store them as-is
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zipf:
+        for path in paths:
+            info = zipfile.ZipInfo.from_file(path, os.path.basename(path))
+            info.compress_type = zipfile.ZIP_STORED
+            with zipf.open(info, 'w', force_zip64=True) as member:
+                for chunk in _iter_file_chunks(path):
+                    member.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    data = buffer.drain()
+    if data:
+        yield data
+
+
+def iter_bulk_archive(paths: list[str], archive_format: str = "tar"):
+    """Stream several package files as one tar or zip archive.
+
+    Bytes are yielded as they are produced, so nothing is staged on disk and
+    at most one chunk per member is held in memory.
+    """
+    if archive_format == "tar":
+        return _iter_tar_stream(paths)
+    if archive_format == "zip":
+        return _iter_zip_stream(paths)
+    raise ValueError(f"Unsupported archive format: {archive_format}")
+
+
+def find_package_file(packages_dir: str, package_id: str) -> Optional[str]:
+    """Return the archive file name for a package ID, or None if it does not exist"""
+    suffix = f"_{package_id}.zip"
+    for filename in os.listdir(packages_dir):
+        if filename.endswith(suffix):
+            return filename
+    return None
+
+
+def _list_changes(old: list, new: list) -> Dict[str, list]:
+    """Items added and removed between two lists, keeping their order"""
+    return {
+        "added": [item for item in new if item not in old],
+        "removed": [item for item in old if item not in new]
+    }
+
+
+def diff_package_metadata(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Compute a structured diff between two packages' metadata"""
+    fields = []
+    for field in ("project_name", "author", "description", "instructions"):
+        if old.get(field) != new.get(field):
+            fields.append({"field": field, "old": old.get(field), "new": new.get(field)})
+
+    old_deps = {dep["name"].lower(): dep for dep in old.get("dependencies") or []}
+    new_deps = {dep["name"].lower(): dep for dep in new.get("dependencies") or []}
+    dependencies = []
+    for key in sorted(old_deps.keys() | new_deps.keys()):
+        old_dep, new_dep = old_deps.get(key), new_deps.get(key)
+        old_version = old_dep["version"] if old_dep else None
+        new_version = new_dep["version"] if new_dep else None
+        if old_version != new_version:
+            dependencies.append({
+                "name": (new_dep or old_dep)["name"],
+                "old_version": old_version,
+                "new_version": new_version
+            })
+
+    old_env = old.get("environment_variables") or {}
+    new_env = new.get("environment_variables") or {}
+    environment_variables = [
+        {"key": key, "old_value": old_env.get(key), "new_value": new_env.get(key)}
+        for key in sorted(old_env.keys() | new_env.keys())
+        if old_env.get(key) != new_env.get(key)
+    ]
+
+    setup_scripts = _list_changes(old.get("setup_scripts") or [], new.get("setup_scripts") or [])
+    dataset_links = _list_changes(old.get("dataset_links") or [], new.get("dataset_links") or [])
+    output_formats = _list_changes(old.get("output_formats") or [], new.get("output_formats") or [])
+    # Reordered setup scripts still change what setup.sh runs
+    scripts_reordered = (
+        not setup_scripts["added"] and not setup_scripts["removed"]
+        and (old.get("setup_scripts") or []) != (new.get("setup_scripts") or [])
+    )
+
+    return {
+        "package_a": old["package_id"],
+        "package_b": new["package_id"],
+        "identical": not (
+            fields or dependencies or environment_variables or scripts_reordered
+            or any(setup_scripts.values()) or any(dataset_links.values())
+            or any(output_formats.values())
+        ),
+        "fields": fields,
+        "dependencies": dependencies,
+        "environment_variables": environment_variables,
+        "setup_scripts": {**setup_scripts, "reordered": scripts_reordered},
+        "dataset_links": dataset_links,
+        "output_formats": output_formats
+    }
+
+
+@lru_cache(maxsize=1024)
+def diff_package_files(packages_dir: str, filename_a: str, filename_b: str) -> Optional[Dict[str, Any]]:
+    """Diff two stored packages from their metadata alone
+
+    Results are memoized per pair: archives are immutable once published and
+    their file names embed the package ID.
+    """
+    old = load_package_metadata(os.path.join(packages_dir, filename_a))
+    new = load_package_metadata(os.path.join(packages_dir, filename_b))
+    if old is None or new is None:
+        return None
+    return diff_package_metadata(old, new)